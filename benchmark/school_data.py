@@ -0,0 +1,59 @@
+import os
+import random
+
+from openpyxl import Workbook
+from pptx import Presentation
+
+from service.score_analyse import DATA_FILES
+
+# 低年级只有语文、数学两科，表格为5列；其他年级多一列英语
+LOW_GRADES = ['一年级', '二年级']
+
+
+# 生成一所学校的模拟成绩数据，目录结构与ScoreAnalyseService读取的一致
+def generate_school(root_dir, classes=8, students=45, invalid_rate=0.02, grades=None, seed=0):
+    rand = random.Random(seed)
+    os.makedirs(f'{root_dir}/data/read', exist_ok=True)
+    template_path = f'{root_dir}/data/成绩分析模板.pptx'
+    if not os.path.exists(template_path): Presentation().save(template_path)
+
+    for file_name in DATA_FILES:
+        grade_name = file_name.replace('.xlsx', '')
+        if grades is not None and grade_name not in grades: continue
+        # 使用普通工作簿保存，保证与Excel一样写出表格尺寸，只读加载时每行列数一致
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for class_no in range(1, classes + 1):
+            sheet = workbook.create_sheet(str(class_no))
+            sheet.append(grade_header(grade_name))
+            for stu_no in range(1, students + 1):
+                sheet.append(student_row(rand, grade_name, class_no, f'学生{class_no:02d}{stu_no:03d}', invalid_rate))
+        workbook.save(f'{root_dir}/data/read/{file_name}')
+
+
+def grade_header(grade_name):
+    header = ['年级', '班级', '姓名', '语文', '数学']
+    return header if grade_name in LOW_GRADES else header + ['英语']
+
+
+def student_row(rand: random.Random, grade_name, class_no, name, invalid_rate):
+    is_low_grade = grade_name in LOW_GRADES
+    row = [grade_name, class_no, name] + [random_score(rand) for _ in range(2 if is_low_grade else 3)]
+    if rand.random() >= invalid_rate: return row
+
+    # 模拟缺考、空白等无效单元格：缺少语文或数学成绩，低年级成绩为文本，高年级英语为文本或空白
+    invalid_type = rand.randrange(4)
+    if invalid_type == 0:
+        row[3] = None
+    elif invalid_type == 1:
+        row[4] = None
+    elif is_low_grade:
+        row[3 + invalid_type % 2] = '缺考'
+    else:
+        row[5] = '缺考' if invalid_type == 2 else None
+    return row
+
+
+# 成绩按0.5分取整，近似正态分布
+def random_score(rand: random.Random):
+    return min(max(round(rand.gauss(78, 14) * 2) / 2, 0.0), 100.0)
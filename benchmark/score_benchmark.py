@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+from openpyxl import load_workbook
+from pptx import Presentation
+
+from benchmark.school_data import generate_school, student_row
+from model.student_model import StudentBuffer
+from service.score_analyse import ScoreAnalyseService
+
+# 计时阶段，按执行顺序排列
+STAGES = ['load', 'class_analyse', 'grade_analyse', 'write_excel', 'write_pptx', 'save']
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.stages = {stage: 0.0 for stage in STAGES}
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] += time.perf_counter() - start
+
+
+# 按阶段分别计时一次完整的学校分析
+def benchmark_school(root_dir, write_only=False):
+    service = ScoreAnalyseService(root_dir, use_cache=False, write_only=write_only)
+    school_workbook = service.new_workbook()
+    school_ppt = Presentation(service.ppt_template_path)
+    grades = {}
+    for file_path in service.file_paths:
+        if not os.path.exists(file_path): continue
+        title = service.grade_title(file_path)
+        timer = StageTimer()
+        with timer('load'):
+            workbook = load_workbook(file_path, True, False, True)
+        with timer('class_analyse'):
+            grade_score = service.class_analyse(title, workbook)
+        workbook.close()
+        with timer('grade_analyse'):
+            school_score = grade_score.analyse()
+        with timer('write_excel'):
+            service.write_sheet(school_workbook.create_sheet(title), title, school_score)
+        with timer('write_pptx'):
+            service.write_slides(school_ppt, title, school_score)
+        grades[title] = dict(timer.stages, students=int(grade_score.array.size))
+
+    timer = StageTimer()
+    with timer('save'):
+        school_workbook.save(service.result_path)
+        school_ppt.save(service.ppt_result_path)
+    stages = {stage: sum(grade[stage] for grade in grades.values()) for stage in STAGES}
+    stages['save'] = timer.stages['save']
+    return {'grades': grades, 'stages': stages, 'total': sum(stages.values())}
+
+
+def run_benchmark(classes=8, students=45, invalid_rate=0.02, grades=None, repeat=3, write_only=False, seed=0):
+    params = dict(classes=classes, students=students, invalid_rate=invalid_rate, grades=grades, repeat=repeat,
+                  write_only=write_only, seed=seed)
+    with tempfile.TemporaryDirectory() as root_dir:
+        generate_school(root_dir, classes, students, invalid_rate, grades, seed)
+        runs = [benchmark_school(root_dir, write_only) for _ in range(repeat)]
+    # 各阶段取多次运行的最小值，减少偶发抖动
+    best = min(runs, key=lambda run: run['total'])
+    stages = {stage: min(run['stages'][stage] for run in runs) for stage in STAGES}
+    return {'meta': environment(), 'params': params, 'stages': stages, 'total': min(run['total'] for run in runs),
+            'grades': best['grades']}
+
+
+# 只计时成绩行的整块校验和转换，不含读取工作簿
+def benchmark_validate(rows=200000, grade_name='三年级', invalid_rate=0.02, repeat=3, seed=0):
+    rand = random.Random(seed)
+    stu_rows = [tuple(student_row(rand, grade_name, idx % 8 + 1, f'学生{idx:06d}', invalid_rate)) for idx in range(rows)]
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        StudentBuffer().append_rows(stu_rows, grade_name)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'openpyxl': openpyxl.__version__,
+            'machine': platform.machine()}
+
+
+# 输出各阶段耗时，有历史结果时附上与其相比的耗时比例
+def compare(result, baseline=None):
+    lines = []
+    for stage in STAGES + ['total']:
+        current = result['total'] if stage == 'total' else result['stages'][stage]
+        line = f'{stage:>14}: {current:8.3f}s'
+        if baseline is not None:
+            previous = baseline['total'] if stage == 'total' else baseline['stages'].get(stage)
+            line += f'  {current / previous:.2f}x' if previous else '  -'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def parse_args():
+    parser = ArgumentParser(description='成绩分析性能测试')
+    parser.add_argument('-c', '--classes', type=int, default=8, help='每个年级班级数')
+    parser.add_argument('-s', '--students', type=int, default=45, help='每个班级学生数')
+    parser.add_argument('--invalid-rate', type=float, default=0.02, help='无效成绩行比例')
+    parser.add_argument('-g', '--grades', nargs='*', help='只生成指定年级，默认全部六个年级')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='重复运行次数，取最小值')
+    parser.add_argument('--write-only', action='store_true', help='使用只写工作簿')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('-o', '--output', help='结果JSON保存路径')
+    parser.add_argument('-b', '--baseline', help='对比的历史结果JSON')
+    parser.add_argument('--validate-rows', type=int, help='只测试指定行数的成绩行校验转换耗时')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # 无效成绩行的警告不输出
+    logging.getLogger().setLevel(logging.ERROR)
+    args = parse_args()
+    if args.validate_rows:
+        for grade in args.grades or ['一年级', '三年级']:
+            validate_seconds = benchmark_validate(args.validate_rows, grade, args.invalid_rate, args.repeat, args.seed)
+            print(f'{grade} validate {args.validate_rows} rows: {validate_seconds:8.3f}s')
+        raise SystemExit
+    bench_result = run_benchmark(args.classes, args.students, args.invalid_rate, args.grades, args.repeat,
+                                 args.write_only, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(bench_result, output_file, ensure_ascii=False, indent=2)
+    baseline_result = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline_result = json.load(baseline_file)
+    print(compare(bench_result, baseline_result))
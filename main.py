@@ -1,7 +1,12 @@
 import logging
+from argparse import ArgumentParser
 from os.path import dirname
 
+from service.district_analyse import DistrictAnalyseService
 from service.score_analyse import ScoreAnalyseService
+from service.score_cache import ScoreCache, CACHE_MAX_BYTES
+from service.score_monitor import StageMonitor, MONITOR_MODES, MONITOR_ENV
+from service.score_server import ScoreServer, SERVER_PORT
 
 ROOT_DIR = dirname(__file__)
 
@@ -9,5 +14,60 @@ logging.getLogger().setLevel(logging.INFO)
 # noinspection SpellCheckingInspection
 logging.basicConfig(format='%(asctime)s - %(levelname)7s: %(message)s')
 
+
+def parse_args():
+    parser = ArgumentParser(description='学校成绩分析')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='年级分析进程数，默认串行分析')
+    parser.add_argument('-p', '--pipeline', type=int, nargs='?', const=2, default=0,
+                        help='流水线模式，写入当前年级时后台预取解析后续年级，默认预取2个年级')
+    parser.add_argument('-i', '--incremental', action='store_true', help='增量分析，只重新分析输入变化的年级')
+    parser.add_argument('--write-only', action='store_true', help='结果工作簿按行流式写入，减少内存占用')
+    parser.add_argument('--no-cache', action='store_true', help='不读取也不写入成绩解析缓存')
+    parser.add_argument('--clear-cache', action='store_true', help='分析前清空成绩解析缓存')
+    parser.add_argument('--cache-size', type=int, default=CACHE_MAX_BYTES // 1024 // 1024, help='缓存上限(MB)')
+    parser.add_argument('--export', action='store_true', help='同时导出列式指标表和关爱学生表（Parquet，无pyarrow时为CSV）')
+    parser.add_argument('--rules', help='分析规则文件（JSON或TOML）：及格、特优分数，关爱比例，低年级和各年级规则')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='分块分析每块行数，超大年级文件按块读取，只保留各班部分聚合和后k名学生')
+    parser.add_argument('--term', help='学期名称，保存本学期学生成绩并在结果工作表中增加与上学期对比的趋势列')
+    parser.add_argument('--school-year', type=int,
+                        help='学年起始年份，用于按届对比学期历史，默认取学期名称开头的年份（如2024-2025上）')
+    parser.add_argument('--monitor', choices=MONITOR_MODES,
+                        help=f'分阶段监控：time 计时，memory 计时和内存峰值，也可用环境变量{MONITOR_ENV}开启')
+    parser.add_argument('--profile', help='cProfile统计结果保存路径')
+    parser.add_argument('--schools', nargs='+', help='批量分析的学校目录，每个目录下为data/read')
+    parser.add_argument('--manifest', help='批量分析的学校清单文件，JSON数组或每行一个目录')
+    parser.add_argument('--school-workers', type=int, default=1, help='批量分析时同时分析的学校数')
+    parser.add_argument('--serve', type=int, nargs='?', const=SERVER_PORT,
+                        help=f'常驻服务模式，在本机端口（默认{SERVER_PORT}）提供指标查询和报表生成')
+    parser.add_argument('--district', action='store_true', help='批量分析时计算区平，幻灯片增加区平行、与区平差和名次')
+    return parser.parse_args()
+
+
+def district_analyse(args):
+    school_dirs = list(args.schools or [])
+    if args.manifest: school_dirs += DistrictAnalyseService.read_manifest(args.manifest)
+    DistrictAnalyseService(school_dirs, f'{ROOT_DIR}/data', args.school_workers, args.district,
+                           clear_cache=args.clear_cache, monitor_mode=args.monitor, profile_path=args.profile,
+                           workers=args.workers, use_cache=not args.no_cache,
+                           cache_size=args.cache_size * 1024 * 1024, incremental=args.incremental,
+                           write_only=args.write_only, export=args.export, term=args.term,
+                           pipeline=args.pipeline, rules_path=args.rules, chunk_size=args.chunk_size,
+                           school_year=args.school_year).district_analyse()
+
+
 if __name__ == '__main__':
-    ScoreAnalyseService(ROOT_DIR).school_analyse()
+    args = parse_args()
+    if args.schools or args.manifest:
+        district_analyse(args)
+    else:
+        service = ScoreAnalyseService(ROOT_DIR, args.workers, not args.no_cache, args.cache_size * 1024 * 1024,
+                                      args.incremental, args.write_only,
+                                      StageMonitor.from_env(args.monitor, args.profile), export=args.export,
+                                      term=args.term, pipeline=args.pipeline, rules_path=args.rules,
+                                      chunk_size=args.chunk_size, school_year=args.school_year)
+        if args.clear_cache: ScoreCache(service.cache_dir).clear()
+        if args.serve is not None:
+            ScoreServer(service, port=args.serve).serve_forever()
+        else:
+            service.school_analyse()
@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+from numpy import ndarray
+
+from model.score_model import ClassScore, SubjectScore
+from model.score_rules import GradeRule
+from model.student_model import STU_DTYPE, StudentBuffer
+from model.subject_model import Subjects
+
+
+class ValueCounts:
+
+    def __init__(self):
+        # 按分数取值计数的精确直方图：升序分数取值 各取值人数
+        self.values = np.empty(0, dtype=np.float32)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def add(self, scores: ndarray):
+        values, counts = np.unique(scores, return_counts=True)
+        self.merge(values, counts)
+
+    def merge(self, values: ndarray, counts: ndarray):
+        self.values, inverse = np.unique(np.concatenate((self.values, values)), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate((self.counts, counts)),
+                                  minlength=self.values.size).astype(np.int64)
+
+    def count_le(self, score):
+        return int(self.counts[:np.searchsorted(self.values, self.values.dtype.type(score), side='right')].sum())
+
+    def count_ge(self, score):
+        return int(self.counts[np.searchsorted(self.values, self.values.dtype.type(score), side='left'):].sum())
+
+    # 从低到高第k名（k从1开始）的分数
+    def kth(self, k):
+        return self.values[int(np.searchsorted(np.cumsum(self.counts), k))]
+
+    # 最低k名的分数和
+    def bottom_sum(self, k):
+        cumsum = np.cumsum(self.counts)
+        pos = int(np.searchsorted(cumsum, k))
+        below = int(cumsum[pos - 1]) if pos > 0 else 0
+        return float(self.counts[:pos] @ self.values[:pos].astype(np.float64)) + (k - below) * float(self.values[pos])
+
+
+class BottomRows:
+
+    def __init__(self, subject_code, capacity: int):
+        # 有界的后capacity名学生：保留分数不高于第capacity名的所有学生（同分全部保留，保证与整体排序结果一致）
+        self.subject_code = subject_code
+        self.capacity = capacity
+        self.rows = np.empty(0, dtype=STU_DTYPE)
+
+    def add(self, rows: ndarray):
+        if self.capacity == 0 or rows.size == 0: return
+        rows = np.concatenate((self.rows, rows))
+        if rows.size > self.capacity:
+            scores = rows[self.subject_code]
+            line = np.partition(scores, self.capacity - 1)[self.capacity - 1]
+            rows = rows[scores <= line]
+        self.rows = rows
+
+
+class ClassPartial:
+
+    def __init__(self, name, capacity: int, rule: GradeRule):
+        # 一个班级的可合并部分聚合：人数 各科总分、多科及格人数、分数直方图、后k名学生，低年级二类关爱学生
+        # capacity为工作表数据行数，不少于有效人数，后k名学生按它的关爱比例保留
+        self.name = name
+        self.count = 0
+        care_capacity = int(capacity * rule.care_rate)
+        self.sums = {code: 0.0 for code, _ in Subjects.values()}
+        self.pass_counts = {code: 0 for code, _ in Subjects.values()}
+        self.value_counts = {code: ValueCounts() for code, _ in Subjects.values()}
+        self.bottom_rows = {code: BottomRows(code, care_capacity) for code, _ in Subjects.values()}
+        self.care_rows: Dict[str, List[ndarray]] = {code: [] for code, _ in Subjects.values()}
+
+
+class ChunkedGrade:
+
+    def __init__(self, grade_name, rule: GradeRule, buffer: StudentBuffer):
+        # 分块分析的年级：各班部分聚合，学生成绩只在当前块中，buffer保存年级、班级名称编码
+        self.grade_name = grade_name
+        self.rule = rule
+        self.buffer = buffer
+        self.classes: List[ClassPartial] = []
+        self.school_score: Optional[ClassScore] = None
+
+    def add_class(self, class_name, capacity: int):
+        self.classes.append(ClassPartial(class_name, capacity, self.rule))
+
+    # 当前班级的一块学生成绩
+    def add(self, array: ndarray):
+        partial = self.classes[-1]
+        partial.count += array.size
+        for code, subject_rule in self.rule.subjects.items():
+            scores = array[code]
+            partial.sums[code] += float(scores.sum(dtype=np.float64))
+            partial.value_counts[code].add(scores)
+            if subject_rule.pass_subjects != [code]:
+                pass_mask = np.ones(array.size, dtype=bool)
+                for pass_code, pass_score in subject_rule.pass_rules: pass_mask &= array[pass_code] >= pass_score
+                partial.pass_counts[code] += int(np.count_nonzero(pass_mask))
+            partial.bottom_rows[code].add(array)
+
+    # 低年级第二遍：按校平关爱分数线收集班级关爱学生
+    def add_care(self, class_idx, array: ndarray):
+        partial = self.classes[class_idx]
+        for code, _ in Subjects.values():
+            _care_score, _, _ = getattr(self.school_score, code).care_stu_2
+            partial.care_rows[code].append(array[array[code] <= _care_score])
+
+    # 由部分聚合得到班级和校平指标：计数、关爱指标与GradeScore.analyse相同，平均分按float64累加，末位可能与其相差0.0001
+    def analyse(self) -> List[ClassScore]:
+        empty = np.empty(0, dtype=STU_DTYPE)
+        code_names = {'grade_code': sorted(self.buffer.grade_names), 'class_code': sorted(self.buffer.class_names)}
+        class_scores = [ClassScore(self.grade_name, partial.name, empty, self.rule.low_grade, code_names)
+                        for partial in self.classes]
+        self.school_score = ClassScore(self.grade_name, '校平', empty, self.rule.low_grade, code_names)
+        school_score = class_scores + [self.school_score]
+        sizes = np.array([partial.count for partial in self.classes] + [sum(p.count for p in self.classes)])
+        for class_score, size in zip(school_score, sizes): class_score.total_stu = int(size)
+
+        for subject in Subjects:
+            current, _ = subject.value
+            subject_rule = self.rule.subjects[current]
+            school_values = ValueCounts()
+            for partial in self.classes: school_values.merge(partial.value_counts[current].values,
+                                                             partial.value_counts[current].counts)
+            value_counts = [partial.value_counts[current] for partial in self.classes] + [school_values]
+
+            sums = np.array([partial.sums[current] for partial in self.classes])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = (np.append(sums, sums.sum()) / sizes).astype(np.float32)
+            if subject == Subjects.TWO: means = means / 2
+            if subject_rule.pass_subjects == [current]:
+                pass_counts = np.array([counts.count_ge(subject_rule.pass_score) for counts in value_counts])
+            else:
+                pass_counts = np.array([partial.pass_counts[current] for partial in self.classes])
+                pass_counts = np.append(pass_counts, pass_counts.sum())
+            top_counts = np.array([counts.count_ge(subject_rule.top_score) for counts in value_counts])
+
+            for idx, class_score in enumerate(school_score):
+                _subject: SubjectScore = getattr(class_score, current)
+                total_stu = class_score.total_stu
+                _subject.mean = _subject.round(means[idx])
+                _subject.pass_stu = int(pass_counts[idx]), _subject.round(pass_counts[idx] / total_stu * 100)
+                _subject.top_stu = int(top_counts[idx]), _subject.round(top_counts[idx] / total_stu * 100)
+            self.analyse_care(school_score, subject, value_counts)
+        return school_score
+
+    def analyse_care(self, school_score: List[ClassScore], subject: Subjects, value_counts: List[ValueCounts]):
+        current, _ = subject.value
+        # 校平关爱指标由直方图得到，关爱学生只在班级中列出
+        school_subject: SubjectScore = getattr(self.school_score, current)
+        school_values = value_counts[-1]
+        total_stu = self.school_score.total_stu
+        _care_count = int(total_stu * self.rule.care_rate)
+        school_subject.care_stu_array = np.empty(0, dtype=STU_DTYPE)
+        if _care_count > 0:
+            _care_mean = np.float32(np.float32(school_values.bottom_sum(_care_count)) / _care_count)
+            school_subject.care_stu_1 = _care_count, school_subject.round(_care_mean)
+            school_subject.care_stu_2 = school_values.kth(_care_count), _care_count, school_subject.round(
+                (total_stu - _care_count) / total_stu * 100)
+        else:
+            school_subject.care_stu_1 = _care_count, school_subject.round(np.nan)
+        _care_score, _, _ = school_subject.care_stu_2
+
+        for class_score, partial, counts in zip(school_score, self.classes, value_counts):
+            _subject: SubjectScore = getattr(class_score, current)
+            total_stu = class_score.total_stu
+            _care_count = int(total_stu * self.rule.care_rate)
+            if _care_count > 0:
+                _care_line = counts.kth(_care_count)
+                care_rows = self.recode(partial.bottom_rows[current].rows)
+                _care_array = np.sort(care_rows[care_rows[current] <= _care_line], order=current)[:_care_count][::-1]
+            else:
+                _care_array = np.empty(0, dtype=STU_DTYPE)
+            with np.errstate(invalid='ignore'):
+                _care_mean = _care_array[current].mean() if _care_count > 0 else np.float32(np.nan)
+            _subject.care_stu_1 = _care_count, _subject.round(_care_mean)
+            _subject.care_stu_array = _care_array
+
+            _class_care_count = counts.count_le(_care_score)
+            _subject.care_stu_2 = _care_score, _class_care_count, _subject.round(
+                (total_stu - _class_care_count) / total_stu * 100)
+
+    # 低年级第二遍收集完成后，用二类关爱学生替换关爱学生列表
+    def finish_care(self, school_score: List[ClassScore]):
+        for class_score, partial in zip(school_score, self.classes):
+            for code, _ in Subjects.values():
+                care_rows = self.recode(np.concatenate(partial.care_rows[code] or [np.empty(0, dtype=STU_DTYPE)]))
+                getattr(class_score, code).care_stu_array = np.sort(care_rows, order=code)[::-1]
+                partial.care_rows[code] = []
+
+    # 块内编码为首次出现次序，改为与整体解析一致的名称排序次序
+    def recode(self, rows: ndarray) -> ndarray:
+        rows = rows.copy()
+        StudentBuffer.recode(rows['grade_code'], self.buffer.grade_names)
+        StudentBuffer.recode(rows['class_code'], self.buffer.class_names)
+        return rows
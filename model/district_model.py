@@ -0,0 +1,119 @@
+import hashlib
+from typing import Dict, List
+
+import numpy as np
+from numpy import ndarray
+
+from model.chunk_model import ValueCounts
+from model.score_model import ClassScore, GradeScore, SubjectScore
+from model.score_rules import GradeRule, DEFAULT_SCORE_RULES
+from model.student_model import STU_DTYPE
+from model.subject_model import Subjects
+
+
+class SubjectAggregate:
+
+    def __init__(self, subject: Subjects, care_rate):
+        # 可合并的科目部分聚合：人数 总分 及格人数 特优人数 关爱比例
+        self.subject = subject
+        self.care_rate = care_rate
+        self.count = 0
+        self.total = 0.0
+        self.pass_count = 0
+        self.top_count = 0
+        # 按分数取值的精确计数，不按固定精度分箱，任意小数位的成绩合并后关爱分数线和平均分不变
+        self.value_counts = ValueCounts()
+
+    def add(self, scores: ndarray, pass_count, top_count):
+        self.count += scores.size
+        self.total += float(scores.sum(dtype=np.float64))
+        self.pass_count += int(pass_count)
+        self.top_count += int(top_count)
+        self.value_counts.add(scores)
+
+    def merge(self, other: 'SubjectAggregate'):
+        self.count += other.count
+        self.total += other.total
+        self.pass_count += other.pass_count
+        self.top_count += other.top_count
+        self.value_counts.merge(other.value_counts.values, other.value_counts.counts)
+
+    # 关爱指标：后care_rate的人数、分数线和平均分，由分数计数累计得到
+    def care_stu(self):
+        care_count = int(self.count * self.care_rate)
+        if care_count == 0: return 0, 0.0, 0.0
+        care_line = float(self.value_counts.kth(care_count))
+        return care_count, care_line, self.value_counts.bottom_sum(care_count) / care_count
+
+    # 转为区平SubjectScore，与班级、校平使用同样的指标格式
+    def to_subject_score(self) -> SubjectScore:
+        subject_score = SubjectScore(self.subject)
+        mean = self.total / self.count if self.count else 0.0
+        if self.subject == Subjects.TWO: mean /= 2
+        care_count, care_line, care_mean = self.care_stu()
+        subject_score.mean = subject_score.round(mean)
+        subject_score.pass_stu = self.pass_count, subject_score.round(self.rate(self.pass_count))
+        subject_score.top_stu = self.top_count, subject_score.round(self.rate(self.top_count))
+        subject_score.care_stu_1 = care_count, subject_score.round(care_mean)
+        subject_score.care_stu_2 = care_line, care_count, subject_score.round(self.rate(self.count - care_count))
+        subject_score.care_stu_array = np.empty(0, dtype=STU_DTYPE)
+        return subject_score
+
+    def rate(self, count):
+        return count / self.count * 100 if self.count else 0.0
+
+
+class GradeAggregate:
+
+    def __init__(self, grade_name, rule: GradeRule = None):
+        # 年级名称 年级指标计划 各科部分聚合 区内各班平均分（用于排名）
+        self.grade_name = grade_name
+        self.rule = DEFAULT_SCORE_RULES.grade(grade_name) if rule is None else rule
+        self.subjects: Dict[str, SubjectAggregate] = {subject.value[0]: SubjectAggregate(subject, self.rule.care_rate)
+                                                      for subject in Subjects}
+        self.class_means: Dict[str, List[float]] = {code: [] for code, _ in Subjects.values()}
+        self.sorted_means: Dict[str, ndarray] = {}
+
+    # 由一所学校的年级成绩生成部分聚合：只计算平均分、及格和特优指标，不做关爱分析
+    @classmethod
+    def from_grade(cls, grade_score: GradeScore) -> 'GradeAggregate':
+        aggregate = cls(grade_score.grade_name, grade_score.rule)
+        for subject in Subjects:
+            current, _ = subject.value
+            grade_score.analyse_summary(subject)
+            school_subject: SubjectScore = getattr(grade_score.school_score, current)
+            aggregate.subjects[current].add(grade_score.array[current], school_subject.pass_stu[0],
+                                            school_subject.top_stu[0])
+            aggregate.class_means[current] = [getattr(class_score, current).mean
+                                              for class_score in grade_score.class_scores]
+        return aggregate
+
+    def merge(self, other: 'GradeAggregate'):
+        for code, subject in self.subjects.items():
+            subject.merge(other.subjects[code])
+            self.class_means[code] = self.class_means[code] + other.class_means[code]
+        self.sorted_means = {}
+
+    # 区平ClassScore
+    def to_class_score(self) -> ClassScore:
+        class_score = ClassScore(self.grade_name, '区平', np.empty(0, dtype=STU_DTYPE), self.rule.low_grade)
+        class_score.total_stu = self.subjects[Subjects.CHINESE.value[0]].count
+        for code, subject in self.subjects.items(): setattr(class_score, code, subject.to_subject_score())
+        return class_score
+
+    # 班级平均分在区内各班中的名次
+    def rank(self, subject_code, mean):
+        if subject_code not in self.sorted_means:
+            self.sorted_means[subject_code] = np.sort(self.class_means[subject_code])
+        sorted_means = self.sorted_means[subject_code]
+        return 1 + sorted_means.size - int(np.searchsorted(sorted_means, mean, side='right'))
+
+    # 区级聚合指纹，区平变化时增量分析需重写幻灯片
+    def digest(self):
+        digest = hashlib.sha256()
+        for code, subject in self.subjects.items():
+            digest.update(f'{code}|{subject.count}|{subject.total}|{subject.pass_count}|{subject.top_count}'.encode())
+            digest.update(subject.value_counts.values.tobytes())
+            digest.update(subject.value_counts.counts.tobytes())
+            digest.update(np.asarray(self.class_means[code], dtype=np.float64).tobytes())
+        return digest.hexdigest()
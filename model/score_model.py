@@ -1,19 +1,13 @@
-from typing import Optional
+import copy
+from typing import Dict, Optional, List
 
 import numpy as np
 from numpy import ndarray
 
+from model.score_rules import GradeRule, DEFAULT_SCORE_RULES
+from model.student_model import decode
 from model.subject_model import Subjects
 
-# 及格分数
-PASS_SCORE = 60.0
-# 单科特优分数
-SINGLE_TOP_SCORE = 92.5
-# 两科特优分数
-TWO_TOP_SCORE = 185.0
-# 关爱人数比例
-CARE_RATE = 0.2
-
 
 class SubjectScore:
 
@@ -32,71 +26,9 @@ class SubjectScore:
         self.care_stu_2 = (0.0, 0, 0.0)
         # 关爱学生列表
         self.care_stu_array: Optional[ndarray] = None
-
-    def analyse(self, class_score: 'ClassScore'):
-        chinese, _ = Subjects.CHINESE.value
-        math, _ = Subjects.MATH.value
-        english, _ = Subjects.ENGLISH.value
-        two, _ = Subjects.TWO.value
-        current, _ = self.subject.value
-
-        total_stu = class_score.total_stu
-        stu_array = class_score.array
-        subject_array = stu_array[current]
-
-        if self.subject != Subjects.TWO:
-            # 单科成绩分析
-            _mean = subject_array.mean()
-            _pass_count = stu_array[subject_array >= PASS_SCORE].size
-            _top_count = stu_array[subject_array >= SINGLE_TOP_SCORE].size
-        else:
-            # 总评成绩分析
-            _chinese_pass = (stu_array[chinese] >= PASS_SCORE)
-            _math_pass = (stu_array[math] >= PASS_SCORE)
-            _english_pass = (stu_array[english] >= PASS_SCORE)
-
-            _mean = subject_array.mean() / 2
-            if class_score.is_low_grade:
-                _pass_count = stu_array[_chinese_pass & _math_pass].size
-            else:
-                _pass_count = stu_array[_chinese_pass & _math_pass & _english_pass].size
-            _top_count = stu_array[subject_array >= TWO_TOP_SCORE].size
-
-        _pass_rate = _pass_count / total_stu * 100
-        _top_rate = _top_count / total_stu * 100
-
-        _care_count = int(total_stu * CARE_RATE)
-        _care_array = np.sort(stu_array, order=current)[:_care_count][::-1]
-        _subject_array = _care_array[current]
-        _care_mean = _subject_array.mean()
-
-        self.mean = self.round(_mean)
-        self.pass_stu = _pass_count, self.round(_pass_rate)
-        self.top_stu = _top_count, self.round(_top_rate)
-        self.care_stu_1 = _care_count, self.round(_care_mean)
-        self.care_stu_array = _care_array
-
-        # 校平分析最后算出关爱分数线
-        if class_score.is_school_class:
-            self.care_stu_2 = _subject_array.max(), _care_count, self.round((total_stu - _care_count) / total_stu * 100)
-
-    def analyse_care(self, class_score: 'ClassScore', school_score: 'SubjectScore'):
-        if class_score.is_school_class: return
-        current, _ = self.subject.value
-
-        total_stu = class_score.total_stu
-        stu_array = class_score.array
-        subject_array = stu_array[current]
-
-        _care_score, _, _ = school_score.care_stu_2
-        _care_array = np.sort(stu_array[subject_array <= _care_score], order=current)[::-1]
-        _care_count = _care_array.size
-
-        self.care_stu_2 = _care_score, _care_count, self.round((total_stu - _care_count) / total_stu * 100)
-
-        # 低年级使用二类关爱指标，重新赋值关爱学生列表
-        if class_score.is_low_grade:
-            self.care_stu_array = _care_array
+        # 与上学期相比：平均分变化，连续两学期在关爱名单中的人数，None为没有上学期数据
+        self.mean_delta = None
+        self.care_repeat = None
 
     @staticmethod
     def round(num):
@@ -105,31 +37,228 @@ class SubjectScore:
 
 class ClassScore:
 
-    def __init__(self, grade_name, name: str, array: ndarray):
+    def __init__(self, grade_name, name: str, array: ndarray, low_grade=None, code_names=None):
         # 年级名称 班级名称 总人数 语文成绩 数学成绩 英语成绩 总评成绩
         self.grade_name = grade_name
         self.name = name
         self.array = array
         self.total_stu = array.size
+        # 学生成绩中年级、班级编码对应的名称，关爱学生列表输出时还原
+        self.code_names = {} if code_names is None else code_names
+        # 是否按低年级规则分析，默认由默认规则判断
+        self.low_grade = DEFAULT_SCORE_RULES.grade(grade_name).low_grade if low_grade is None else low_grade
         self.chinese = SubjectScore(Subjects.CHINESE)
         self.math = SubjectScore(Subjects.MATH)
         self.english = SubjectScore(Subjects.ENGLISH)
         self.two = SubjectScore(Subjects.TWO)
 
-    def analyse(self):
-        for sub, _ in Subjects.values():
-            subject: SubjectScore = getattr(self, sub)
-            subject.analyse(self)
+    # 只保留指标和关爱学生、去掉班级学生成绩的副本，用于保存和跨进程传递
+    def without_students(self) -> 'ClassScore':
+        class_score = copy.copy(self)
+        class_score.array = np.empty(0, dtype=self.array.dtype)
+        return class_score
 
-    def analyse_care(self, school_score: 'ClassScore'):
-        for sub, _ in Subjects.values():
-            subject: SubjectScore = getattr(self, sub)
-            subject.analyse_care(self, getattr(school_score, sub))
+    # 学生成绩（如关爱学生列表）中编码列对应的名称
+    def decode(self, array: ndarray, column):
+        return decode(array[column], self.code_names.get(column, []))
 
     @property
     def is_low_grade(self):
-        return self.grade_name == '一年级' or self.grade_name == '二年级'
+        return self.low_grade
 
     @property
     def is_school_class(self):
         return self.name == '校平'
+
+
+class ScoreIndex:
+
+    def __init__(self, scores: ndarray, class_codes: ndarray, class_count):
+        # 成绩有界且精度固定，取值个数远少于人数：升序分数取值，各班按取值的累计人数（最后一行为校平）
+        self.values, inverse = np.unique(scores, return_inverse=True)
+        counts = np.bincount(class_codes.astype(np.int64) * self.values.size + inverse,
+                             minlength=class_count * self.values.size).reshape(class_count, self.values.size)
+        counts = np.vstack((counts, counts.sum(axis=0)))
+        self.cumsum = np.cumsum(counts, axis=1)
+        self.sizes = self.cumsum[:, -1] if self.values.size else np.zeros(class_count + 1, dtype=np.int64)
+
+    # 各班不高于score的人数
+    def count_le(self, score) -> ndarray:
+        pos = int(np.searchsorted(self.values, self.values.dtype.type(score), side='right'))
+        return self.cumsum[:, pos - 1] if pos > 0 else np.zeros_like(self.sizes)
+
+    # 各班不低于score的人数
+    def count_ge(self, score) -> ndarray:
+        pos = int(np.searchsorted(self.values, self.values.dtype.type(score), side='left'))
+        return self.sizes - self.cumsum[:, pos - 1] if pos > 0 else self.sizes.copy()
+
+    # 第idx组从低到高第k名（k从1开始）的分数
+    def kth(self, idx, k):
+        return self.values[int(np.searchsorted(self.cumsum[idx], k))]
+
+
+class GradeScore:
+
+    def __init__(self, grade_name, class_names: List[str], array: ndarray, class_codes: ndarray,
+                 rule: GradeRule = None, code_names: Dict[str, List[str]] = None):
+        # 年级名称 班级名称列表 年级学生成绩 学生所在班级编号（按班级顺序连续排列） 年级指标计划
+        # 学生成绩中年级、班级编码对应的名称（StudentBuffer.code_names）
+        self.grade_name = grade_name
+        self.rule = DEFAULT_SCORE_RULES.grade(grade_name) if rule is None else rule
+        self.class_names = class_names
+        self.code_names = {} if code_names is None else code_names
+        self.array = array
+        self.class_codes = class_codes
+        self.class_sizes = np.bincount(class_codes, minlength=len(class_names))
+        # 各班在年级数组中的起止位置
+        self.class_bounds = np.concatenate(([0], np.cumsum(self.class_sizes)))
+        self.school_score = ClassScore(grade_name, '校平', array, self.rule.low_grade, self.code_names)
+        self.class_scores = [ClassScore(grade_name, name, array[start:end], self.rule.low_grade, self.code_names)
+                             for name, start, end in zip(class_names, self.class_bounds[:-1], self.class_bounds[1:])]
+        # 各科分数索引，首次使用时建立
+        self.score_indexes = {}
+        # 已计算的指标（班级序号，科目，指标组），校平序号为班级数
+        self.analysed = set()
+
+    def score_index(self, subject: Subjects) -> ScoreIndex:
+        current, _ = subject.value
+        if current not in self.score_indexes:
+            self.score_indexes[current] = ScoreIndex(self.array[current], self.class_codes, len(self.class_names))
+        return self.score_indexes[current]
+
+    # 全年级该科第q百分位的分数（最近秩）
+    def percentile(self, subject: Subjects, q):
+        total_stu = self.array.size
+        if total_stu == 0: return None
+        k = min(max(int(np.ceil(q / 100 * total_stu)), 1), total_stu)
+        return self.score_index(subject).kth(len(self.class_names), k)
+
+    # 该科成绩在全年级（或指定班级）中的名次，同分同名次
+    def rank(self, subject: Subjects, score, class_name=None):
+        idx = len(self.class_names) if class_name is None else self.class_names.index(class_name)
+        index = self.score_index(subject)
+        return int(index.sizes[idx] - index.count_le(score)[idx]) + 1
+
+    def analyse(self) -> List[ClassScore]:
+        school_score = self.class_scores + [self.school_score]
+        for subject in Subjects:
+            self.analyse_summary(subject)
+            for idx in range(len(school_score)): self.analyse_second_care(idx, subject)
+        return school_score
+
+    # 按需查询单个指标，首次访问时计算并缓存，metric为SubjectScore的属性名，班级名为'校平'时查询全校
+    def get(self, class_name, subject: Subjects, metric):
+        idx = len(self.class_names) if class_name == '校平' else self.class_names.index(class_name)
+        if metric in ('mean', 'pass_stu', 'top_stu'):
+            self.analyse_summary(subject)
+        elif metric == 'care_stu_1' or (metric == 'care_stu_array' and not self.school_score.is_low_grade):
+            self.analyse_first_care(idx, subject)
+        else:
+            self.analyse_second_care(idx, subject)
+        current, _ = subject.value
+        return getattr(getattr(self.class_score(idx), current), metric)
+
+    def class_score(self, idx) -> ClassScore:
+        return self.school_score if idx == len(self.class_names) else self.class_scores[idx]
+
+    # 平均分、及格和特优指标，各班和校平一次算出
+    def analyse_summary(self, subject: Subjects):
+        subject_code, _ = subject.value
+        if (None, subject_code, 'summary') in self.analysed: return
+        self.analysed.add((None, subject_code, 'summary'))
+
+        means, pass_counts, top_counts = self.group_count(subject)
+        for idx, class_score in enumerate(self.class_scores + [self.school_score]):
+            _subject: SubjectScore = getattr(class_score, subject_code)
+            total_stu = class_score.total_stu
+            _subject.mean = _subject.round(means[idx])
+            _subject.pass_stu = int(pass_counts[idx]), _subject.round(pass_counts[idx] / total_stu * 100)
+            _subject.top_stu = int(top_counts[idx]), _subject.round(top_counts[idx] / total_stu * 100)
+
+    # 一类关爱指标和关爱学生列表，校平同时得到关爱分数线
+    def analyse_first_care(self, idx, subject: Subjects):
+        subject_code, _ = subject.value
+        if (idx, subject_code, 'care') in self.analysed: return
+        self.analysed.add((idx, subject_code, 'care'))
+        class_score = self.class_score(idx)
+        self.analyse_care(idx, class_score, getattr(class_score, subject_code))
+
+    # 二类关爱指标：依赖校平关爱分数线，低年级在一类关爱之后重新赋值关爱学生列表
+    def analyse_second_care(self, idx, subject: Subjects):
+        subject_code, _ = subject.value
+        school_idx = len(self.class_names)
+        self.analyse_first_care(school_idx, subject)
+        self.analyse_first_care(idx, subject)
+        if idx == school_idx or (idx, subject_code, 'school_care') in self.analysed: return
+        self.analysed.add((idx, subject_code, 'school_care'))
+        self.analyse_school_care(idx, subject)
+
+    # 按班级分组一次统计平均分、及格人数和特优人数，最后一项为校平
+    def group_count(self, subject: Subjects):
+        current, _ = subject.value
+        subject_rule = self.rule.subjects[current]
+
+        # 单科及格、特优人数直接由分数索引查出，多科同时及格（如总评）按掩码计数
+        index = self.score_index(subject)
+        subject_array = self.array[current]
+        if subject_rule.pass_subjects == [current]:
+            pass_counts = index.count_ge(subject_rule.pass_score)
+        else:
+            pass_mask = np.ones(self.array.size, dtype=bool)
+            for code, pass_score in subject_rule.pass_rules: pass_mask &= self.array[code] >= pass_score
+            pass_counts = self.group_sum(pass_mask)
+        top_counts = index.count_ge(subject_rule.top_score)
+
+        # 平均分与逐班ndarray.mean()一致：各班为连续切片，按float32累加，不改变报表中的小数位
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.array([subject_array[start:end].mean() for start, end in
+                              zip(self.class_bounds[:-1], self.class_bounds[1:])] + [subject_array.mean()],
+                             dtype=np.float32)
+        if subject == Subjects.TWO: means = means / 2
+        return means, pass_counts, top_counts
+
+    def group_sum(self, values: ndarray):
+        sums = np.bincount(self.class_codes, weights=values, minlength=len(self.class_names))
+        return np.append(sums, sums.sum())
+
+    # 一类关爱指标：关爱分数线由分数索引查出，只排序分数线以下的学生
+    def analyse_care(self, idx, class_score: ClassScore, subject_score: SubjectScore):
+        current, _ = subject_score.subject.value
+        total_stu = class_score.total_stu
+        stu_array = class_score.array
+        subject_array = stu_array[current]
+
+        _care_count = int(total_stu * self.rule.care_rate)
+        if _care_count > 0:
+            _care_line = self.score_index(subject_score.subject).kth(idx, _care_count)
+            _care_array = np.sort(stu_array[subject_array <= _care_line], order=current)[:_care_count][::-1]
+        else:
+            _care_array = stu_array[:0]
+        _subject_array = _care_array[current]
+        with np.errstate(invalid='ignore'):
+            _care_mean = _subject_array.mean() if _care_count > 0 else np.float32(np.nan)
+
+        subject_score.care_stu_1 = _care_count, subject_score.round(_care_mean)
+        subject_score.care_stu_array = _care_array
+
+        # 校平分析最后算出关爱分数线
+        if class_score.is_school_class:
+            subject_score.care_stu_2 = _subject_array.max(), _care_count, subject_score.round(
+                (total_stu - _care_count) / total_stu * 100)
+
+    # 二类关爱指标：由分数索引查出班级中不高于校平关爱分数线的人数
+    def analyse_school_care(self, idx, subject: Subjects):
+        current, _ = subject.value
+        school_subject: SubjectScore = getattr(self.school_score, current)
+        _care_score, _, _ = school_subject.care_stu_2
+
+        class_score = self.class_scores[idx]
+        _subject: SubjectScore = getattr(class_score, current)
+        total_stu = class_score.total_stu
+        _care_count = int(self.score_index(subject).count_le(_care_score)[idx])
+        _subject.care_stu_2 = _care_score, _care_count, _subject.round((total_stu - _care_count) / total_stu * 100)
+
+        # 低年级使用二类关爱指标，重新赋值关爱学生列表
+        if class_score.is_low_grade:
+            stu_array = class_score.array
+            _subject.care_stu_array = np.sort(stu_array[stu_array[current] <= _care_score], order=current)[::-1]
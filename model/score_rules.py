@@ -0,0 +1,120 @@
+import copy
+import hashlib
+import json
+from typing import Dict, List
+
+import numpy as np
+
+from model.subject_model import Subjects
+
+try:
+    import tomllib
+except ImportError:
+    # Python 3.11以下没有tomllib，只支持JSON规则文件
+    tomllib = None
+
+# 及格分数
+PASS_SCORE = 60.0
+# 单科特优分数
+SINGLE_TOP_SCORE = 92.5
+# 两科特优分数
+TWO_TOP_SCORE = 185.0
+# 关爱人数比例
+CARE_RATE = 0.2
+
+# 默认规则，规则文件中的同名项逐层覆盖：全局 -> 低年级 -> 指定年级
+DEFAULT_RULES = {
+    'care_rate': CARE_RATE,
+    'subjects': {
+        'chinese': {'pass_score': PASS_SCORE, 'top_score': SINGLE_TOP_SCORE},
+        'math': {'pass_score': PASS_SCORE, 'top_score': SINGLE_TOP_SCORE},
+        'english': {'pass_score': PASS_SCORE, 'top_score': SINGLE_TOP_SCORE},
+        'two': {'top_score': TWO_TOP_SCORE, 'pass_subjects': ['chinese', 'math', 'english']},
+    },
+    'low_grades': ['一年级', '二年级'],
+    # 低年级没有英语，总评及格只看语文、数学，关爱指标使用二类关爱
+    'low_grade': {'subjects': {'two': {'pass_subjects': ['chinese', 'math']}}},
+    'grades': {},
+}
+
+
+class SubjectRule:
+
+    def __init__(self, code, pass_score=PASS_SCORE, top_score=SINGLE_TOP_SCORE, pass_subjects: List[str] = None):
+        # 科目编码 及格分数 特优分数 及格需同时达到及格分数的科目（默认为本科目）
+        self.code = code
+        self.pass_score = pass_score
+        self.top_score = top_score
+        self.pass_subjects = [code] if pass_subjects is None else pass_subjects
+        # （科目编码，及格分数），由GradeRule按各科自己的及格分数编译
+        self.pass_rules = []
+
+
+class GradeRule:
+
+    def __init__(self, grade_name, rule: Dict):
+        # 编译后的年级指标计划：是否低年级 关爱比例 各科及格、特优规则
+        self.grade_name = grade_name
+        self.low_grade = rule['low_grade']
+        self.care_rate = rule['care_rate']
+        self.subjects: Dict[str, SubjectRule] = {}
+        for code, _ in Subjects.values():
+            subject_rule = rule['subjects'].get(code, {})
+            # 分数线转为成绩的float32类型，恰好压线的成绩与逐行比较的结果一致
+            self.subjects[code] = SubjectRule(code, np.float32(subject_rule.get('pass_score', PASS_SCORE)),
+                                              np.float32(subject_rule.get('top_score', SINGLE_TOP_SCORE)),
+                                              subject_rule.get('pass_subjects'))
+        # 总评及格的科目按各自的及格分数判断
+        for subject_rule in self.subjects.values():
+            subject_rule.pass_rules = [(code, self.subjects[code].pass_score) for code in subject_rule.pass_subjects]
+        self.digest = hashlib.sha256(json.dumps(rule, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class ScoreRules:
+
+    def __init__(self, rules: Dict = None):
+        # 规则文件内容，未指定的项使用默认规则
+        self.rules = merge_rules(DEFAULT_RULES, rules or {})
+        self.grades: Dict[str, GradeRule] = {}
+        subject_codes = [code for code, _ in Subjects.values()]
+        sections = [self.rules, self.rules['low_grade']] + list(self.rules['grades'].values())
+        for section in sections:
+            for code, subject_rule in section.get('subjects', {}).items():
+                for _code in [code] + subject_rule.get('pass_subjects', []):
+                    if _code not in subject_codes: raise ValueError(f'规则文件中的未知科目：{_code}')
+
+    # 读取JSON或TOML规则文件
+    @classmethod
+    def load(cls, rules_path) -> 'ScoreRules':
+        if rules_path.endswith('.toml'):
+            if tomllib is None: raise ValueError('当前Python版本不支持TOML规则文件，请使用JSON')
+            with open(rules_path, 'rb') as rules_file:
+                return cls(tomllib.load(rules_file))
+        with open(rules_path, encoding='utf-8') as rules_file:
+            return cls(json.load(rules_file))
+
+    # 编译年级规则，结果按年级缓存
+    def grade(self, grade_name) -> GradeRule:
+        if grade_name not in self.grades:
+            grade_rule = self.rules['grades'].get(grade_name, {})
+            low_grade = grade_rule.get('low_grade', grade_name in self.rules['low_grades'])
+            rule = {key: value for key, value in self.rules.items() if key not in ('low_grades', 'low_grade', 'grades')}
+            if low_grade: rule = merge_rules(rule, self.rules['low_grade'])
+            rule = merge_rules(rule, grade_rule)
+            rule['low_grade'] = low_grade
+            self.grades[grade_name] = GradeRule(grade_name, rule)
+        return self.grades[grade_name]
+
+
+def merge_rules(base: Dict, override: Dict) -> Dict:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_rules(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+# 默认规则，未指定规则文件时使用
+DEFAULT_SCORE_RULES = ScoreRules()
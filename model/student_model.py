@@ -1,48 +1,184 @@
 import logging
-from typing import Tuple
+from itertools import islice
+from typing import Tuple, Dict, List, Iterable
 
 import numpy as np
-from openpyxl.cell import Cell
-from openpyxl.cell.cell import TYPE_NUMERIC
+from numpy import ndarray
+from openpyxl.compat.numbers import NUMERIC_TYPES
 
 from model.subject_model import Subjects
 
-STU_DTYPE = np.dtype({'names': ['grade_name', 'class_name', 'name'] + [sub for sub, _ in Subjects.values()],
-                      'formats': ['U32', 'U32', 'U32', 'f', 'f', 'f', 'f']})
+# 年级、班级名称以编码存储，姓名仍为定长字符串
+STU_DTYPE = np.dtype({'names': ['grade_code', 'class_code', 'name'] + [sub for sub, _ in Subjects.values()],
+                      'formats': ['u2', 'u2', 'U32', 'f', 'f', 'f', 'f']})
+# 被忽略的成绩行：工作表 行号 原因编码
+REJECT_DTYPE = np.dtype([('sheet', 'U32'), ('row', 'u4'), ('reason', 'u1')])
+# 忽略原因，按is_valid_stu的检查顺序编码
+REJECT_REASONS = ['', '缺少语文或数学成绩', '语文或数学成绩不是数字', '英语成绩不是数字']
+# 数值单元格的类型和空单元格类型，按类型精确比较（bool是int的子类，不在其中）
+NUMERIC_CLASSES = frozenset(NUMERIC_TYPES) | {type(None)}
+# 整列取单元格类型
+value_type = np.frompyfunc(type, 1, 1)
+# 名称编码列，以及编码列以外的学生成绩列
+CODE_COLUMNS = ['grade_code', 'class_code']
+STU_COLUMNS = [name for name in STU_DTYPE.names if name not in CODE_COLUMNS]
+# 整块写入时每块的行数，解析内存随块大小而不随工作表行数增长
+BLOCK_ROWS = 4096
 
 
-class Student:
+class StudentBuffer:
 
-    def __init__(self, row: Tuple[Cell, ...]):
+    def __init__(self, capacity=1024):
+        # 预分配、按需倍增的年级成绩缓冲区，按块写入，只为当前块生成中间对象
+        self.array = np.empty(capacity, dtype=STU_DTYPE)
+        self.size = 0
+        # 名称到编码的映射，finish后为按编码排列的名称列表
+        self.grade_names: Dict[str, int] = {}
+        self.class_names: Dict[str, int] = {}
+        # 整块写入时被忽略的成绩行
+        self.rejects: List[ndarray] = []
+
+    def reserve(self, capacity):
+        if capacity <= self.array.size: return
+        array = np.empty(capacity, dtype=STU_DTYPE)
+        array[:self.size] = self.array[:self.size]
+        self.array = array
+
+    def append(self, row: Tuple) -> bool:
         # 年级 班级 学生姓名 语文 数学 英语 总评
-        self.grade_name: str = row[0].value
-        self.class_name: str = str(row[1].value)
-        self.name: str = row[2].value
-        self.chinese = float(row[3].value)
-        self.math = float(row[4].value)
-        self.two = self.chinese + self.math
-        if len(row) == 5 or row[5] is None or row[5].value is None:
-            self.english = float(0)
+        if not is_valid_stu(row): return False
+        if self.size == self.array.size: self.reserve(self.array.size * 2)
+
+        chinese, math = float(row[3]), float(row[4])
+        english = float(0) if len(row) == 5 or row[5] is None else float(row[5])
+        self.array[self.size] = (self.code(self.grade_names, row[0]), self.code(self.class_names, row[1]), row[2],
+                                 chinese, math, english, chinese + math)
+        self.size += 1
+        return True
+
+    # 整块校验并写入一个工作表的成绩行：按列生成校验掩码，有效行按列批量转换，被忽略的行只记录行号和原因
+    def append_rows(self, rows: List[Tuple], sheet_name='', first_row=2) -> int:
+        if not rows: return 0
+        widths = set(map(len, rows))
+        width = len(rows[0])
+        if len(widths) > 1:
+            # 各行列数不一致时逐行写入
+            return sum(self.append(row) for row in rows)
+        block = np.empty((len(rows), width), dtype=object)
+        block[:] = rows
+
+        chinese, math = block[:, 3], block[:, 4]
+        reasons = np.zeros(len(rows), dtype=np.uint8)
+        if width == 5:
+            reasons[~(numeric_mask(chinese) & numeric_mask(math))] = 2
+        elif width == 6:
+            reasons[~numeric_mask(block[:, 5])] = 3
+        reasons[np.equal(chinese, None) | np.equal(math, None)] = 1
+
+        valid = reasons == 0
+        if not valid.all():
+            rejects = np.empty(np.count_nonzero(~valid), dtype=REJECT_DTYPE)
+            rejects['sheet'] = sheet_name
+            rejects['row'] = np.flatnonzero(~valid) + first_row
+            rejects['reason'] = reasons[~valid]
+            self.rejects.append(rejects)
+            block = block[valid]
+
+        count = block.shape[0]
+        if self.size + count > self.array.size: self.reserve(max(self.size + count, 2 * self.array.size))
+        array = self.array[self.size:self.size + count]
+        chinese, math = block[:, 3].astype(np.float64), block[:, 4].astype(np.float64)
+        if width == 5:
+            english = np.zeros(count)
         else:
-            self.english = float(row[5].value)
+            english = block[:, 5]
+            english = np.where(np.equal(english, None), 0.0, english).astype(np.float64)
+        array['grade_code'] = self.codes(self.grade_names, block[:, 0])
+        array['class_code'] = self.codes(self.class_names, block[:, 1])
+        array['name'] = block[:, 2].astype(str)
+        array['chinese'], array['math'], array['english'], array['two'] = chinese, math, english, chinese + math
+        self.size += count
+        return count
 
-    @property
-    def to_tuple(self):
-        return self.grade_name, self.class_name, self.name, self.chinese, self.math, self.english, self.two
+    # 按BLOCK_ROWS行分块写入一个工作表的成绩行，不一次性生成整个工作表的行列表
+    def append_sheet(self, rows: Iterable[Tuple], sheet_name='', first_row=2) -> int:
+        rows, count = iter(rows), 0
+        while True:
+            block = list(islice(rows, BLOCK_ROWS))
+            if not block: return count
+            count += self.append_rows(block, sheet_name, first_row)
+            first_row += len(block)
 
+    def finish(self) -> ndarray:
+        array = self.array[:self.size]
+        # 编码改为名称排序次序，与按名称字符串排序的结果保持一致
+        self.grade_names = self.recode(array['grade_code'], self.grade_names)
+        self.class_names = self.recode(array['class_code'], self.class_names)
+        return array
 
-def is_valid_stu(row: Tuple[Cell, ...]):
-    chinese_cell, math_cell = row[3], row[4]
-    if chinese_cell is None or math_cell is None:
-        logging.warning(f'该学生成绩忽略:{[r.value for r in row]}')
-        return False
-    if chinese_cell.value is None or math_cell.value is None:
-        logging.warning(f'该学生成绩忽略:{[r.value for r in row]}')
+    # 编码列 -> 按编码排列的名称，finish后与成绩数组一起保存，输出时还原名称
+    def code_names(self) -> Dict[str, List[str]]:
+        return {'grade_code': list(self.grade_names), 'class_code': list(self.class_names)}
+
+    @staticmethod
+    def code(names: Dict[str, int], value) -> int:
+        return names.setdefault(str(value), len(names))
+
+    # 整列编码，只对不同取值查找映射
+    @classmethod
+    def codes(cls, names: Dict[str, int], values: ndarray) -> ndarray:
+        unique, inverse = np.unique(values.astype(str), return_inverse=True)
+        return np.array([cls.code(names, value) for value in unique], dtype=np.int64)[inverse]
+
+    def rejected(self) -> ndarray:
+        return np.concatenate(self.rejects) if self.rejects else np.empty(0, dtype=REJECT_DTYPE)
+
+    @staticmethod
+    def recode(codes: ndarray, names: Dict[str, int]):
+        sorted_names = sorted(names)
+        ranks = np.empty(len(names), dtype=codes.dtype)
+        ranks[[names[name] for name in sorted_names]] = np.arange(len(names))
+        codes[:] = ranks[codes]
+        return sorted_names
+
+
+# 编码还原为名称，没有编码表时为空字符串
+def decode(codes: ndarray, names: List[str]) -> ndarray:
+    if not names: return np.full(codes.shape, '', dtype='U1')
+    return np.asarray(names, dtype=str)[codes]
+
+
+def is_numeric(value):
+    return value is None or (not isinstance(value, bool) and isinstance(value, NUMERIC_TYPES))
+
+
+# 整列判断是否为数值或空：按单元格类型整列比较，bool不是数值，与is_numeric一致
+def numeric_mask(values: ndarray) -> ndarray:
+    types = value_type(values)
+    mask = np.zeros(values.size, dtype=bool)
+    for present_type in set(types.tolist()):
+        if present_type in NUMERIC_CLASSES: mask |= types == np.array(present_type, dtype=object)
+    return mask
+
+
+# 汇总输出被忽略的成绩行，每个年级一条日志
+def log_rejects(grade_name, rejects: ndarray):
+    if rejects.size == 0: return
+    counts = np.bincount(rejects['reason'], minlength=len(REJECT_REASONS))
+    reasons = '，'.join(f'{REJECT_REASONS[idx]}{count}行' for idx, count in enumerate(counts) if count)
+    rows = ' '.join(f'{sheet}!{row}' for sheet, row in zip(rejects['sheet'][:20], rejects['row'][:20]))
+    logging.warning(f'{grade_name}共忽略{rejects.size}名学生成绩：{reasons}（{rows}{" ..." if rejects.size > 20 else ""}）')
+
+
+def is_valid_stu(row: Tuple):
+    chinese, math = row[3], row[4]
+    if chinese is None or math is None:
+        logging.warning(f'该学生成绩忽略:{list(row)}')
         return False
-    if len(row) == 5 and (chinese_cell.data_type != TYPE_NUMERIC or math_cell.data_type != TYPE_NUMERIC):
-        logging.warning(f'该学生成绩忽略:{[r.value for r in row]}')
+    if len(row) == 5 and (not is_numeric(chinese) or not is_numeric(math)):
+        logging.warning(f'该学生成绩忽略:{list(row)}')
         return False
-    if len(row) == 6 and row[5].data_type != TYPE_NUMERIC:
-        logging.warning(f'该学生成绩忽略:{[r.value for r in row]}')
+    if len(row) == 6 and not is_numeric(row[5]):
+        logging.warning(f'该学生成绩忽略:{list(row)}')
         return False
     return True
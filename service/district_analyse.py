@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from openpyxl.workbook import Workbook
+
+from model.district_model import GradeAggregate
+from model.subject_model import Subjects
+from service.excel_styles import set_cell, set_title_cell, set_float_cell
+from service.score_analyse import ScoreAnalyseService, DATA_FILES
+from service.score_cache import ScoreCache
+from service.score_monitor import StageMonitor
+
+
+class SchoolResult:
+
+    def __init__(self, school_dir):
+        # 学校名称 学校目录 是否成功 耗时 错误信息 各年级校平分析结果
+        self.name = os.path.basename(os.path.normpath(school_dir))
+        self.school_dir = school_dir
+        self.success = False
+        self.seconds = 0.0
+        self.error = ''
+        self.grades = {}
+        # 各年级区级部分聚合
+        self.aggregates = {}
+
+
+class DistrictAnalyseService:
+
+    def __init__(self, school_dirs: List[str], result_dir, school_workers=1, district=False, clear_cache=False,
+                 monitor_mode=None, profile_path=None, **school_options):
+        # 学校目录列表 区级汇总保存目录 同时分析的学校数 是否计算区平 传给各校ScoreAnalyseService的参数
+        self.school_dirs = school_dirs
+        self.summary_path = f'{result_dir}/区级成绩汇总.xlsx'
+        self.school_workers = school_workers
+        self.district = district
+        self.school_options = school_options
+        # 分析前清空各校成绩解析缓存
+        self.clear_cache = clear_cache
+        # 各校分阶段监控模式，监控结果保存在各校目录下
+        self.monitor_mode = monitor_mode
+        # 区级整体运行的cProfile统计，多进程时只统计主进程
+        self.monitor = StageMonitor(profile_path=profile_path)
+
+    # 读取学校清单：JSON数组或每行一个目录，相对路径相对清单所在目录
+    @staticmethod
+    def read_manifest(manifest_path) -> List[str]:
+        with open(manifest_path, encoding='utf-8') as manifest_file:
+            content = manifest_file.read()
+        if content.lstrip().startswith('['):
+            school_dirs = json.loads(content)
+        else:
+            school_dirs = [line.strip() for line in content.splitlines()]
+            school_dirs = [line for line in school_dirs if line and not line.startswith('#')]
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        return [os.path.join(base_dir, school_dir) for school_dir in school_dirs]
+
+    # 区级批量分析，单个学校失败不影响其他学校
+    def district_analyse(self) -> List[SchoolResult]:
+        with self.monitor.profile():
+            return self.schools_analyse()
+
+    def schools_analyse(self) -> List[SchoolResult]:
+        district = None
+        school_dirs = self.school_dirs
+        if self.district:
+            # 第一遍各校只计算部分聚合并合并为区平，第二遍各校按区平生成报表
+            aggregate_results = self.map_schools(self.school_aggregate, school_dirs, self.clear_cache)
+            district = self.merge_aggregates(aggregate_results)
+            school_dirs = [result.school_dir for result in aggregate_results if result.success]
+        results = self.map_schools(self.school_analyse, school_dirs, district, self.clear_cache and not self.district)
+        if self.district:
+            # 汇总失败的学校不再分析，按清单顺序记入结果
+            analysed = iter(results)
+            results = [next(analysed) if result.success else result for result in aggregate_results]
+
+        self.write_summary(results, district)
+        failed = [result.name for result in results if not result.success]
+        logging.info(f'区级分析完成！共{len(results)}所学校，失败{len(failed)}所{failed if failed else ""}')
+        return results
+
+    # 按学校执行，多进程时同时分析的学校数不超过school_workers
+    def map_schools(self, func, school_dirs, *args) -> List[SchoolResult]:
+        if self.school_workers <= 1: return [func(school_dir, *args) for school_dir in school_dirs]
+        with ProcessPoolExecutor(max_workers=self.school_workers) as executor:
+            futures = [executor.submit(func, school_dir, *args) for school_dir in school_dirs]
+            return [self.future_result(future, school_dir) for future, school_dir in zip(futures, school_dirs)]
+
+    # 学校分析服务，每所学校单独监控，第一遍分析前按需清空该校缓存
+    def school_service(self, school_dir, clear_cache, district: Dict[str, GradeAggregate] = None):
+        service = ScoreAnalyseService(school_dir, monitor=StageMonitor.from_env(self.monitor_mode),
+                                      district=district, **self.school_options)
+        if clear_cache: ScoreCache(service.cache_dir).clear()
+        return service
+
+    def school_analyse(self, school_dir, district: Dict[str, GradeAggregate] = None, clear_cache=False) -> SchoolResult:
+        result = SchoolResult(school_dir)
+        start = time.perf_counter()
+        logging.info(f'{result.name}开始分析')
+        try:
+            result.grades = self.school_service(school_dir, clear_cache, district).school_analyse()
+            result.success = True
+        except Exception as e:
+            result.error = f'{type(e).__name__}: {e}'
+            logging.exception(f'{result.name}分析失败')
+        result.seconds = time.perf_counter() - start
+        return result
+
+    # 区平第一遍：只计算该校各年级的部分聚合，结果写入缓存供第二遍复用
+    def school_aggregate(self, school_dir, clear_cache=False) -> SchoolResult:
+        result = SchoolResult(school_dir)
+        start = time.perf_counter()
+        try:
+            result.aggregates = self.school_service(school_dir, clear_cache).school_aggregate()
+            result.success = True
+        except Exception as e:
+            result.error = f'{type(e).__name__}: {e}'
+            logging.exception(f'{result.name}汇总失败')
+        result.seconds = time.perf_counter() - start
+        return result
+
+    # 合并各校部分聚合，得到各年级区平
+    @staticmethod
+    def merge_aggregates(results: List[SchoolResult]) -> Dict[str, GradeAggregate]:
+        district = {}
+        for result in results:
+            for title, aggregate in result.aggregates.items():
+                district.setdefault(title, GradeAggregate(aggregate.grade_name, aggregate.rule)).merge(aggregate)
+        return district
+
+    # 分析进程异常退出时同样记为该校失败
+    @staticmethod
+    def future_result(future, school_dir) -> SchoolResult:
+        try:
+            return future.result()
+        except Exception as e:
+            result = SchoolResult(school_dir)
+            result.error = f'{type(e).__name__}: {e}'
+            logging.error(f'{result.name}分析失败：{result.error}')
+            return result
+
+    # 保存区级汇总：各校分析状态，以及各年级各校的校平指标（计算区平时末行为区平）
+    def write_summary(self, results: List[SchoolResult], district: Dict[str, GradeAggregate] = None):
+        workbook = Workbook()
+        status_sheet = workbook.active
+        status_sheet.title = '学校汇总'
+        for idx, header in enumerate(['学校', '目录', '状态', '耗时(秒)', '错误信息']):
+            set_title_cell(status_sheet.cell(1, idx + 1), header)
+        for row, result in enumerate(results, 2):
+            set_cell(status_sheet.cell(row, 1), result.name)
+            set_cell(status_sheet.cell(row, 2), result.school_dir)
+            set_cell(status_sheet.cell(row, 3), '成功' if result.success else '失败')
+            set_float_cell(status_sheet.cell(row, 4), result.seconds)
+            set_cell(status_sheet.cell(row, 5), result.error)
+
+        for file_name in DATA_FILES:
+            title = file_name.replace('.xlsx', '')
+            school_scores = [(result.name, result.grades[title]) for result in results if title in result.grades]
+            if school_scores and district and title in district:
+                school_scores.append(('区平', district[title].to_class_score()))
+            if school_scores: self.write_grade_summary(workbook.create_sheet(title), school_scores)
+        os.makedirs(os.path.dirname(self.summary_path), exist_ok=True)
+        workbook.save(self.summary_path)
+
+    @staticmethod
+    def write_grade_summary(grade_sheet, school_scores):
+        is_low_grade = school_scores[0][1].is_low_grade
+        subjects = [subject for subject in Subjects if not (is_low_grade and subject == Subjects.ENGLISH)]
+        headers = ['学校', '总人数']
+        for subject in subjects:
+            _, subject_name = subject.value
+            headers += [f'{subject_name}平均分', f'{subject_name}及格率', f'{subject_name}特优率']
+        for idx, header in enumerate(headers): set_title_cell(grade_sheet.cell(1, idx + 1), header)
+
+        for row, (school_name, school_score) in enumerate(school_scores, 2):
+            set_cell(grade_sheet.cell(row, 1), school_name)
+            set_cell(grade_sheet.cell(row, 2), school_score.total_stu)
+            for idx, subject in enumerate(subjects):
+                subject_code, _ = subject.value
+                _subject = getattr(school_score, subject_code)
+                set_float_cell(grade_sheet.cell(row, idx * 3 + 3), _subject.mean)
+                set_float_cell(grade_sheet.cell(row, idx * 3 + 4), _subject.pass_stu[1])
+                set_float_cell(grade_sheet.cell(row, idx * 3 + 5), _subject.top_stu[1])
@@ -1,5 +1,5 @@
-from openpyxl.cell import Cell
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, Color
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, Color, NamedStyle
 from pptx.dml.color import RGBColor
 from pptx.enum.text import MSO_VERTICAL_ANCHOR, PP_ALIGN
 
@@ -9,6 +9,11 @@ __fill = PatternFill('solid', fgColor=Color('e3e3e3'))
 __thin_side = Side(style='thin', color='000000')
 __thin_border = Border(__thin_side, __thin_side, __thin_side, __thin_side)
 
+# 单元格样式名称，只写模式下作为命名样式在工作簿中注册一次
+TITLE_STYLE = '分析标题'
+CELL_STYLE = '分析数据'
+FLOAT_STYLE = '分析小数'
+
 
 def set_title_cell(cell: Cell, value) -> Cell:
     return set_cell(cell, value, __bold, __center, __fill)
@@ -29,6 +34,37 @@ def set_cell(cell: Cell, value, font: Font = None, align: Alignment = None, fill
     return cell
 
 
+def set_style_cell(cell: Cell, value, style: str) -> Cell:
+    if style == TITLE_STYLE: return set_title_cell(cell, value)
+    if style == FLOAT_STYLE: return set_float_cell(cell, value)
+    return set_cell(cell, value)
+
+
+def register_styles(workbook):
+    workbook.add_named_style(NamedStyle(TITLE_STYLE, font=__bold, fill=__fill, border=__thin_border,
+                                         alignment=__center))
+    workbook.add_named_style(NamedStyle(CELL_STYLE, border=__thin_border))
+    workbook.add_named_style(NamedStyle(FLOAT_STYLE, border=__thin_border, number_format='0.00'))
+
+
+# 逐个单元格写入普通工作表
+def write_cells(sheet, cells):
+    for row, column, value, style in cells: set_style_cell(sheet.cell(row, column), value, style)
+
+
+# 按行顺序写入只写工作表，单元格需按（行，列）递增排列
+def write_rows(sheet, cells):
+    current, row_cells = 1, {}
+    for row, column, value, style in cells:
+        while current < row:
+            sheet.append([row_cells.get(idx) for idx in range(1, max(row_cells, default=0) + 1)])
+            current, row_cells = current + 1, {}
+        cell = WriteOnlyCell(sheet, value)
+        cell.style = style
+        row_cells[column] = cell
+    if row_cells: sheet.append([row_cells.get(idx) for idx in range(1, max(row_cells) + 1)])
+
+
 def set_center_cell(cell, value: str, color=None):
     cell.text = value
     cell.vertical_anchor = MSO_VERTICAL_ANCHOR.MIDDLE
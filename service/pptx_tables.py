@@ -0,0 +1,57 @@
+import copy
+from functools import lru_cache
+
+from pptx.oxml.ns import qn
+from pptx.oxml.shapes.graphfrm import CT_GraphicalObjectFrame
+from pptx.shapes.graphfrm import GraphicFrame
+from pptx.table import Table
+
+from service.excel_styles import set_center_cell
+
+
+# 表格模板：同样的表头和行数只排版一次，之后每张幻灯片复制模板的XML
+@lru_cache(maxsize=None)
+def table_template(headers, max_row, data_rows, left, top, width, height):
+    graphic_frame = CT_GraphicalObjectFrame.new_table_graphicFrame(0, '', max_row, len(headers), left, top,
+                                                                   width, height)
+    table = GraphicFrame(graphic_frame, None).table
+    for idx, header in enumerate(headers):
+        table.columns[idx].width = width
+        set_center_cell(table.cell(0, idx), header)
+    for row_idx in range(1, data_rows + 1): table.rows[row_idx].height = height
+    return graphic_frame
+
+
+# 居中单元格模板，与set_center_cell写出的XML一致
+@lru_cache(maxsize=None)
+def center_cell_template():
+    graphic_frame = CT_GraphicalObjectFrame.new_table_graphicFrame(0, '', 1, 1, 0, 0, 0, 0)
+    cell = GraphicFrame(graphic_frame, None).table.cell(0, 0)
+    set_center_cell(cell, ' ')
+    return cell._tc
+
+
+# 在幻灯片上添加表格，表头、列宽和行高由模板复制
+def add_table(slide, headers, max_row, data_rows, left, top, width, height) -> Table:
+    shapes = slide.shapes
+    graphic_frame = copy.deepcopy(table_template(tuple(headers), max_row, data_rows, left, top, width, height))
+    shape_id = shapes._next_shape_id
+    graphic_frame.nvGraphicFramePr.cNvPr.id = shape_id
+    graphic_frame.nvGraphicFramePr.cNvPr.name = f'Table {shape_id - 1}'
+    shapes._spTree.insert_element_before(graphic_frame, 'p:extLst')
+    return GraphicFrame(graphic_frame, shapes).table
+
+
+# 批量填写居中单元格（行，列，文本），直接替换为单元格模板的副本
+def fill_center_cells(table: Table, cells, color=None):
+    rows = table._tbl.tr_lst
+    template = center_cell_template()
+    for row_idx, col_idx, value in cells:
+        tc = rows[row_idx].tc_lst[col_idx]
+        # 换行和颜色仍按python-pptx逐个设置
+        if color is not None or '\v' in value or '\n' in value:
+            set_center_cell(table.cell(row_idx, col_idx), value, color)
+            continue
+        cell = copy.deepcopy(template)
+        cell.find(f'.//{qn("a:t")}').text = value
+        tc.getparent().replace(tc, cell)
@@ -1,85 +1,403 @@
+import heapq
 import logging
 import os
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import chain, islice
+from typing import List, Dict
+from xml.parsers import expat
 
 import numpy as np
 from openpyxl import load_workbook
 from openpyxl.workbook import Workbook
+from openpyxl.xml.constants import SHEET_MAIN_NS
 from openpyxl.worksheet.worksheet import Worksheet
 from pptx import Presentation
 from pptx.util import Inches
 
-from model.score_model import ClassScore, SubjectScore
-from model.student_model import is_valid_stu, Student, STU_DTYPE
+from model.district_model import GradeAggregate
+from model.chunk_model import ChunkedGrade
+from model.score_model import ClassScore, SubjectScore, GradeScore
+from model.score_rules import ScoreRules, GradeRule, DEFAULT_SCORE_RULES
+from model.student_model import StudentBuffer, log_rejects
 from model.subject_model import Subjects
-from service.excel_styles import set_cell, set_title_cell, set_float_cell, CellIndex, set_center_cell
+from service.excel_styles import CellIndex, TITLE_STYLE, CELL_STYLE, FLOAT_STYLE, \
+    register_styles, write_cells, write_rows
+from service.pptx_tables import add_table, fill_center_cells
+from service.score_cache import ScoreCache, CACHE_MAX_BYTES
+from service.score_export import ScoreExporter
+from service.score_history import TermHistory
+from service.score_monitor import StageMonitor, NULL_MONITOR
+from service.score_state import AnalyseState, GradeState
 
 DATA_FILES = ['一年级.xlsx', '二年级.xlsx', '三年级.xlsx', '四年级.xlsx', '五年级.xlsx', '六年级.xlsx']
+# Excel工作表最大行数：只读模式默认读到工作表记录的尺寸为止，尺寸偏小时会漏读学生，读取时以此为上限
+EXCEL_MAX_ROW = 1048576
+# 工作表XML中的行标签（expat按命名空间}标签名给出）
+SHEET_ROW_TAG = f'{SHEET_MAIN_NS}}}row'
 
 
 class ScoreAnalyseService:
 
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, workers=1, use_cache=True, cache_size=CACHE_MAX_BYTES, incremental=False,
+                 write_only=False, monitor: StageMonitor = None, district: Dict[str, GradeAggregate] = None,
+                 export=False, term=None, pipeline=0, rules_path=None, chunk_size=0, school_year=None):
         self.file_paths = [f'{root_dir}/data/read/{f}' for f in DATA_FILES]
         self.result_path = f'{root_dir}/data/成绩分析结果.xlsx'
         self.ppt_template_path = f'{root_dir}/data/成绩分析模板.pptx'
         self.ppt_result_path = f'{root_dir}/data/成绩分析结果.pptx'
-
-    # 校级分析
-    def school_analyse(self):
-        school_workbook: Workbook = Workbook()
-        school_workbook.remove(school_workbook['Sheet'])
+        # 年级分析进程数，1为串行分析
+        self.workers = workers
+        # 分块分析每块的行数，0为整体加载：分块时只保留各班部分聚合和后k名学生，不使用解析缓存
+        self.chunk_size = chunk_size
+        # 流水线预取的年级数，0为不预取：写入当前年级结果时后台进程已在解析后续年级
+        self.pipeline = pipeline
+        # 年级成绩解析缓存，None为不使用缓存
+        self.cache_dir = f'{root_dir}/data/cache'
+        self.cache = ScoreCache(self.cache_dir, cache_size) if use_cache else None
+        # 增量分析，只重新分析和重写输入变化的年级
+        self.incremental = incremental
+        self.state_path = f'{self.cache_dir}/analyse_state.pkl'
+        # 结果工作簿使用只写模式，按行流式输出
+        self.write_only = write_only
+        # 分阶段耗时和内存监控，默认按环境变量开启
+        self.monitor = StageMonitor.from_env() if monitor is None else monitor
+        self.monitor_path = f'{root_dir}/data/成绩分析监控.json'
+        # 各年级区级聚合，用于填写区平、与区平差和名次
+        self.district = {} if district is None else district
+        # 同时导出列式指标表和关爱学生表，None为不导出
+        self.exporter = ScoreExporter(f'{root_dir}/data') if export else None
+        # 分析规则，指定规则文件时读取并按年级编译
+        self.rules = ScoreRules.load(rules_path) if rules_path else DEFAULT_SCORE_RULES
+        # 学期历史，指定学期时保存本学期学生成绩并与同一届学生的上学期成绩对比
+        self.history = TermHistory(f'{root_dir}/data/history', term, school_year) if term else None
+
+    # 校级分析，返回各年级校平分析结果
+    def school_analyse(self) -> Dict[str, ClassScore]:
+        with self.monitor.profile():
+            if self.incremental:
+                school_results = self.incremental_analyse()
+            else:
+                school_results = self.full_analyse()
+        self.monitor.save(self.monitor_path)
+        return school_results
+
+    # 全量分析，可传入已分析的（年级，分析结果），默认按年级文件加载分析
+    def full_analyse(self, grade_scores=None):
+        school_results, export_scores = {}, {}
+        school_workbook = self.new_workbook()
         school_ppt = Presentation(self.ppt_template_path)
+        for title, school_score in self.grade_scores() if grade_scores is None else grade_scores:
+            self.record_history(title, school_score)
+            self.write_grade(school_workbook, school_ppt, title, school_score)
+            school_results[title] = school_score[-1].without_students()
+            if self.exporter is not None:
+                export_scores[title] = [class_score.without_students() for class_score in school_score]
+            logging.info(f'{title}分析完成！')
+        with self.monitor.stage('save'):
+            school_workbook.save(self.result_path)
+            school_ppt.save(self.ppt_result_path)
+        self.export(export_scores)
+        logging.info('分析结果保存完成！')
+        return school_results
+
+    # 增量分析：输入未变化的年级沿用上次分析结果，上次结果文件完好时只替换变化年级的工作表和幻灯片
+    def incremental_analyse(self):
+        state = AnalyseState.load(self.state_path)
+        titles = [self.grade_title(file_path) for file_path in self.file_paths]
+        keys = [self.grade_key(title, file_path) for title, file_path in zip(titles, self.file_paths)]
+        changed_paths = [file_path for file_path, title, key in zip(self.file_paths, titles, keys)
+                         if state.grade(title, key) is None]
+        changed_scores = dict(self.grade_scores(changed_paths))
+
+        patchable = state.is_patchable(titles, self.result_path, self.ppt_result_path)
+        if patchable:
+            school_workbook: Workbook = load_workbook(self.result_path)
+            school_ppt = Presentation(self.ppt_result_path)
+        else:
+            school_workbook = self.new_workbook()
+            school_ppt = Presentation(self.ppt_template_path)
+
+        school_results, export_scores = {}, {}
+        current_state = AnalyseState(self.state_path)
+        for title, key in zip(titles, keys):
+            grade_state = state.grade(title, key)
+            school_score = changed_scores[title] if grade_state is None else grade_state.school_score
+            school_results[title] = school_score[-1].without_students()
+            export_scores[title] = school_score
+            if patchable and grade_state is not None:
+                current_state.grades[title] = grade_state
+                continue
+            if patchable:
+                slide_start, slide_count = state.grades[title].slides
+                sheet_index = school_workbook.sheetnames.index(title)
+                school_workbook.remove(school_workbook[title])
+                self.remove_slides(school_ppt, slide_start, slide_count)
+            else:
+                slide_start, sheet_index = len(school_ppt.slides), None
+            if grade_state is None: self.record_history(title, school_score)
+            slide_count = self.write_grade(school_workbook, school_ppt, title, school_score, sheet_index)
+            self.move_slides(school_ppt, slide_start, slide_count)
+            current_state.grades[title] = GradeState(key, school_score, (slide_start, slide_count))
+            logging.info(f'{title}{"分析" if grade_state is None else "重写"}完成！')
+        with self.monitor.stage('save'):
+            school_workbook.save(self.result_path)
+            school_ppt.save(self.ppt_result_path)
+        current_state.save(self.result_path, self.ppt_result_path)
+        self.export(export_scores)
+        logging.info(f'分析结果保存完成！重新分析{len(changed_paths)}个年级')
+        return school_results
+
+    # 导出列式结果，供下游程序读取
+    def export(self, school_scores: Dict[str, List[ClassScore]]):
+        if self.exporter is None: return
+        with self.monitor.stage('export'):
+            metric_path, care_path = self.exporter.export(school_scores)
+        logging.info(f'列式结果导出完成！{metric_path} {care_path}')
+
+    def new_workbook(self) -> Workbook:
+        if self.write_only:
+            school_workbook = Workbook(write_only=True)
+            register_styles(school_workbook)
+        else:
+            school_workbook = Workbook()
+            school_workbook.remove(school_workbook['Sheet'])
+        return school_workbook
+
+    # 增量分析的年级指纹：输入文件指纹和年级规则指纹，有区级聚合时加上区平指纹，有学期历史时加上本学期、学年和上学期
+    def grade_key(self, title, file_path):
+        key = f'{ScoreCache.file_key(file_path)}|{self.rules.grade(title).digest}'
+        if title in self.district: key = f'{key}|{self.district[title].digest()}'
+        if self.history is not None:
+            key = f'{key}|{self.history.term}|{self.history.school_year}|{self.history.previous_term()}'
+        return key
+
+    # 与上学期对比填写趋势指标，并保存本学期学生成绩
+    def record_history(self, title, school_score: List[ClassScore]):
+        if self.history is None: return
+        if self.chunk_size > 0:
+            logging.warning(f'{title}分块分析不保留学生成绩，不保存学期历史')
+            return
+        with self.monitor.stage('history', title):
+            self.history.apply_trend(title, school_score)
+            self.history.record(title, school_score)
+
+    # 学校各年级的区级部分聚合
+    def school_aggregate(self) -> Dict[str, GradeAggregate]:
+        school_aggregates = {}
         for file_path in self.file_paths:
-            title = f'{os.path.basename(file_path)}'.replace('.xlsx', '')
+            title = self.grade_title(file_path)
+            grade_score = self.grade_load(title, file_path)
+            with self.monitor.stage('aggregate', title):
+                school_aggregates[title] = GradeAggregate.from_grade(grade_score)
+        return school_aggregates
+
+    # 按年级顺序返回分析结果，多进程时各年级并行加载分析
+    def grade_scores(self, file_paths=None):
+        file_paths = self.file_paths if file_paths is None else file_paths
+        if self.pipeline > 0 and len(file_paths) > 1:
+            yield from self.pipelined_grade_scores(file_paths)
+            return
+        if self.workers <= 1 or len(file_paths) <= 1:
+            yield from map(self.file_analyse, file_paths)
+            return
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(file_paths))) as executor:
+            for grade_result, records in executor.map(self.pooled_file_analyse, file_paths):
+                self.monitor.merge(records)
+                yield grade_result
+
+    # 流水线分析：按年级顺序提交，已提交未取走的年级不超过pipeline个，内存占用与队列深度成正比
+    def pipelined_grade_scores(self, file_paths):
+        paths = iter(file_paths)
+        with ProcessPoolExecutor(max_workers=max(min(self.workers, self.pipeline), 1)) as executor:
+            pending = deque(executor.submit(self.pooled_file_analyse, file_path)
+                            for file_path in islice(paths, self.pipeline))
+            while pending:
+                grade_result, records = pending.popleft().result()
+                for file_path in islice(paths, 1): pending.append(executor.submit(self.pooled_file_analyse, file_path))
+                self.monitor.merge(records)
+                yield grade_result
+
+    # 进程池中的年级文件分析，监控记录随结果一起返回
+    def pooled_file_analyse(self, file_path):
+        return self.file_analyse(file_path), self.monitor.records
+
+    # 年级文件分析
+    def file_analyse(self, file_path):
+        title = self.grade_title(file_path)
+        if self.chunk_size > 0: return title, self.chunk_analyse(title, file_path)
+        grade_score = self.grade_load(title, file_path)
+        with self.monitor.stage('analyse', title):
+            return title, grade_score.analyse()
+
+    # 只加载不分析的年级成绩，指标通过GradeScore.get按需计算
+    def grade_query(self, title) -> GradeScore:
+        file_path = next(file_path for file_path in self.file_paths if self.grade_title(file_path) == title)
+        return self.grade_load(title, file_path)
+
+    # 加载年级成绩，文件未变化时直接读取解析缓存
+    def grade_load(self, title, file_path) -> GradeScore:
+        if self.cache is None: return self.workbook_load(title, file_path)
+        with self.monitor.stage('cache_load', title):
+            key = self.cache.file_key(file_path)
+            grade_score = self.cache.load(title, key, self.rules.grade(title))
+        if grade_score is None:
+            grade_score = self.workbook_load(title, file_path)
+            with self.monitor.stage('cache_save', title):
+                self.cache.save(title, key, grade_score)
+        return grade_score
+
+    def workbook_load(self, title, file_path) -> GradeScore:
+        with self.monitor.stage('load', title):
+            workbook: Workbook = load_workbook(file_path, True, False, True)
+        try:
+            with self.monitor.stage('parse', title):
+                return self.class_analyse(title, workbook, self.monitor, self.rules.grade(title))
+        finally:
+            workbook.close()
 
+    # 分块分析：按块读取各班成绩并更新部分聚合，内存与班级数和关爱人数成正比，低年级再读一遍收集二类关爱学生
+    def chunk_analyse(self, title, file_path) -> List[ClassScore]:
+        rule = self.rules.grade(title)
+        buffer = StudentBuffer(self.chunk_size)
+        grade = ChunkedGrade(title, rule, buffer)
+        with self.monitor.stage('load', title):
             workbook: Workbook = load_workbook(file_path, True, False, True)
-            school_score = self.grade_analyse(title, workbook)
-            grade_sheet: Worksheet = school_workbook.create_sheet(title)
+        try:
+            for sheetname in workbook.sheetnames:
+                sheet = workbook[sheetname]
+                with self.monitor.stage('parse', title, sheetname):
+                    # 尺寸信息由写入程序记录，可能缺失、偏少或偏大，后k名学生的容量按实际行数确定
+                    grade.add_class(sheetname, self.sheet_rows(sheet))
+                    for chunk in self.sheet_chunks(sheet, buffer): grade.add(chunk)
+            log_rejects(title, buffer.rejected())
+            with self.monitor.stage('analyse', title):
+                school_score = grade.analyse()
+            if rule.low_grade:
+                for idx, sheetname in enumerate(workbook.sheetnames):
+                    with self.monitor.stage('care', title, sheetname):
+                        for chunk in self.sheet_chunks(workbook[sheetname], buffer, False): grade.add_care(idx, chunk)
+                grade.finish_care(school_score)
+        finally:
+            workbook.close()
+        return school_score
+
+    # 按chunk_size行分块读取工作表，每块校验转换后返回块内学生成绩，再次读取时不重复记录被忽略的行
+    def sheet_chunks(self, sheet, buffer: StudentBuffer, record_rejects=True):
+        rows = self.data_rows(sheet)
+        first_row = 2
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk: return
+            buffer.size = 0
+            reject_count = len(buffer.rejects)
+            buffer.append_rows(chunk, sheet.title, first_row)
+            if not record_rejects: del buffer.rejects[reject_count:]
+            first_row += len(chunk)
+            yield buffer.array[:buffer.size].copy()
+
+    # 工作表的成绩行，读到Excel最大行数为止；没有尺寸信息时列数取表头的列数，缺少的单元格补None
+    @staticmethod
+    def data_rows(sheet):
+        max_col = sheet.max_column or len(next(sheet.iter_rows(max_row=1, values_only=True), ()))
+        return sheet.iter_rows(min_row=2, max_row=EXCEL_MAX_ROW, max_col=max_col or None, values_only=True)
 
-            grade_layout = school_ppt.slide_layouts[1]
-            grade_slide = school_ppt.slides.add_slide(grade_layout)
-            grade_slide.shapes.title.text = f'{title}成绩分析'
+    # 工作表数据行数，与data_rows读出的行数相同：只扫描<row>标签的行号，不读取单元格
+    @staticmethod
+    def sheet_rows(sheet) -> int:
+        last_row = 0
 
-            row = CellIndex()
-            for subject in Subjects: self.write_class(grade_sheet, school_score, subject, row)
-            column = CellIndex(12)
-            for subject in Subjects: self.write_care_stu(grade_sheet, school_score, subject, CellIndex(), column)
-            for subject in Subjects: self.write_pptx(school_ppt, title, school_score, subject)
+        def start_element(name, attrs):
+            nonlocal last_row
+            if name == SHEET_ROW_TAG: last_row = int(attrs.get('r', last_row + 1))
 
-            workbook.close()
-            logging.info(f'{title}分析完成！')
-        school_workbook.save(self.result_path)
-        school_ppt.save(self.ppt_result_path)
-        logging.info('分析结果保存完成！')
+        parser = expat.ParserCreate(namespace_separator='}')
+        parser.StartElementHandler = start_element
+        with sheet._get_source() as source: parser.ParseFile(source)
+        return max(last_row - 1, 0)
+
+    @staticmethod
+    def grade_title(file_path):
+        return f'{os.path.basename(file_path)}'.replace('.xlsx', '')
+
+    # 保存年级分析结果，返回新增的幻灯片张数
+    def write_grade(self, school_workbook: Workbook, school_ppt, title, school_score: List[ClassScore],
+                    sheet_index=None):
+        with self.monitor.stage('write_excel', title):
+            self.write_sheet(school_workbook.create_sheet(title, sheet_index), title, school_score)
+        with self.monitor.stage('write_pptx', title):
+            return self.write_slides(school_ppt, title, school_score, self.district.get(title))
+
+    # 保存年级工作表
+    @classmethod
+    def write_sheet(cls, grade_sheet: Worksheet, title, school_score: List[ClassScore]):
+        row = CellIndex()
+        class_cells = chain.from_iterable(cls.class_cells(title, school_score, subject, row) for subject in Subjects)
+        column = CellIndex(12)
+        care_cells = [cls.care_stu_cells(title, school_score, subject, CellIndex(), column) for subject in Subjects]
+        if grade_sheet.parent.write_only:
+            # 只写模式按行输出，合并班级表和各科关爱学生列
+            write_rows(grade_sheet, heapq.merge(class_cells, *care_cells))
+        else:
+            for cells in [class_cells] + care_cells: write_cells(grade_sheet, cells)
+
+    # 保存年级幻灯片，返回新增的幻灯片张数
+    @classmethod
+    def write_slides(cls, school_ppt, title, school_score: List[ClassScore], district: GradeAggregate = None):
+        slide_start = len(school_ppt.slides)
+
+        grade_layout = school_ppt.slide_layouts[1]
+        grade_slide = school_ppt.slides.add_slide(grade_layout)
+        grade_slide.shapes.title.text = f'{title}成绩分析'
+
+        for subject in Subjects: cls.write_pptx(school_ppt, title, school_score, subject, district)
+        return len(school_ppt.slides) - slide_start
+
+    # 删除从start开始的count张幻灯片
+    @staticmethod
+    def remove_slides(school_ppt, start, count):
+        slide_ids = school_ppt.slides._sldIdLst
+        for slide_id in list(slide_ids)[start:start + count]:
+            school_ppt.part.drop_rel(slide_id.rId)
+            slide_ids.remove(slide_id)
+        # 幻灯片文件按新顺序重新编号，避免新增幻灯片与原有文件重名
+        school_ppt.part.rename_slide_parts([slide_id.rId for slide_id in slide_ids])
+
+    # 将末尾的count张幻灯片移动到start位置
+    @staticmethod
+    def move_slides(school_ppt, start, count):
+        slide_ids = school_ppt.slides._sldIdLst
+        moved = list(slide_ids)[len(slide_ids) - count:]
+        for offset, slide_id in enumerate(moved):
+            slide_ids.remove(slide_id)
+            slide_ids.insert(start + offset, slide_id)
+        school_ppt.part.rename_slide_parts([slide_id.rId for slide_id in slide_ids])
 
     # 年级分析
-    def grade_analyse(self, grade_name, workbook: Workbook):
-        school_score: List[ClassScore] = []
-        # 第一遍循环分析基本指标和一类关爱指标
-        for class_score in self.class_analyse(grade_name, workbook):
-            class_score.analyse()
-            school_score.append(class_score)
-        # 第二遍循环分析二类关爱指标
-        for class_score in school_score:
-            class_score.analyse_care(school_score[-1])
-        return school_score
+    @classmethod
+    def grade_analyse(cls, grade_name, workbook: Workbook):
+        return cls.class_analyse(grade_name, workbook).analyse()
 
     # 班级分析
     @staticmethod
-    def class_analyse(grade_name, workbook: Workbook):
-        grade_students = []
+    def class_analyse(grade_name, workbook: Workbook, monitor: StageMonitor = NULL_MONITOR, rule: GradeRule = None):
+        buffer = StudentBuffer()
+        buffer.reserve(sum(max((workbook[sheetname].max_row or 0) - 1, 0) for sheetname in workbook.sheetnames))
+        class_sizes = []
         for sheetname in workbook.sheetnames:
-            sheet = workbook[sheetname]
-            class_students = [Student(row).to_tuple for row in sheet.iter_rows(min_row=2) if is_valid_stu(row)]
-            grade_students.extend(class_students)
-            yield ClassScore(grade_name, sheetname, np.array(class_students, dtype=STU_DTYPE))
-        yield ClassScore(grade_name, '校平', np.array(grade_students, dtype=STU_DTYPE))
-
-    # 保存分析结果
+            start = buffer.size
+            with monitor.stage('parse', grade_name, sheetname):
+                buffer.append_sheet(ScoreAnalyseService.data_rows(workbook[sheetname]), sheetname)
+            class_sizes.append(buffer.size - start)
+        log_rejects(grade_name, buffer.rejected())
+        class_codes = np.repeat(np.arange(len(class_sizes)), class_sizes)
+        array = buffer.finish()
+        return GradeScore(grade_name, workbook.sheetnames, array, class_codes, rule, buffer.code_names())
+
+    # 分析结果单元格，按行列顺序生成（行，列，值，样式）
     @staticmethod
-    def write_class(grade_sheet: Worksheet, school_score: List[ClassScore], subject: Subjects, row: CellIndex):
-        is_low_grade = (grade_sheet.title == '一年级' or grade_sheet.title == '二年级')
+    def class_cells(title, school_score: List[ClassScore], subject: Subjects, row: CellIndex):
+        is_low_grade = school_score[-1].is_low_grade
         if is_low_grade and subject == Subjects.ENGLISH: return
         subject_code, subject_name = subject.value
 
@@ -89,36 +407,41 @@ class ScoreAnalyseService:
 
         headers = ['班级', '总人数', '平均分', f'{pass_name}及格人数', f'{pass_name}及格率', '特优人数', '特优率',
                    f'关爱{care_name}']
+        # 有上学期数据时增加趋势列
+        has_trend = getattr(school_score[-1], subject_code).mean_delta is not None
+        if has_trend: headers += ['较上学期', '连续关爱人数']
 
-        set_title_cell(grade_sheet.cell(row.value, 1), subject_name)
+        yield row.value, 1, subject_name, TITLE_STYLE
         row.next()
 
-        for idx, header in enumerate(headers): set_title_cell(grade_sheet.cell(row.value, idx + 1), header)
+        for idx, header in enumerate(headers): yield row.value, idx + 1, header, TITLE_STYLE
         row.next()
 
         for idx, class_score in enumerate(school_score):
             _subject: SubjectScore = getattr(class_score, subject_code)
             row_index = row.value
-            set_cell(grade_sheet.cell(row_index, 1), class_score.name)
-            set_cell(grade_sheet.cell(row_index, 2), class_score.total_stu)
-            set_float_cell(grade_sheet.cell(row_index, 3), _subject.mean)
-            set_cell(grade_sheet.cell(row_index, 4), _subject.pass_stu[0])
-            set_float_cell(grade_sheet.cell(row_index, 5), _subject.pass_stu[1])
+            yield row_index, 1, class_score.name, CELL_STYLE
+            yield row_index, 2, class_score.total_stu, CELL_STYLE
+            yield row_index, 3, _subject.mean, FLOAT_STYLE
+            yield row_index, 4, _subject.pass_stu[0], CELL_STYLE
+            yield row_index, 5, _subject.pass_stu[1], FLOAT_STYLE
             if subject != Subjects.ENGLISH:
-                set_cell(grade_sheet.cell(row_index, 6), _subject.top_stu[0])
-                set_float_cell(grade_sheet.cell(row_index, 7), _subject.top_stu[1])
+                yield row_index, 6, _subject.top_stu[0], CELL_STYLE
+                yield row_index, 7, _subject.top_stu[1], FLOAT_STYLE
             if is_low_grade:
-                set_float_cell(grade_sheet.cell(row_index, 8), _subject.care_stu_2[2])
+                yield row_index, 8, _subject.care_stu_2[2], FLOAT_STYLE
             else:
-                set_float_cell(grade_sheet.cell(row_index, 8), _subject.care_stu_1[1])
+                yield row_index, 8, _subject.care_stu_1[1], FLOAT_STYLE
+            if has_trend and _subject.mean_delta is not None:
+                yield row_index, 9, _subject.mean_delta, FLOAT_STYLE
+                yield row_index, 10, _subject.care_repeat, CELL_STYLE
             row.next()
         row.next()
 
-    # 保存关爱学生
+    # 关爱学生单元格，按行列顺序生成（行，列，值，样式）
     @staticmethod
-    def write_care_stu(grade_sheet: Worksheet, school_score: List[ClassScore], subject: Subjects, row: CellIndex,
-                       column: CellIndex):
-        is_low_grade = grade_sheet.title == '一年级' or grade_sheet.title == '二年级'
+    def care_stu_cells(title, school_score: List[ClassScore], subject: Subjects, row: CellIndex, column: CellIndex):
+        is_low_grade = school_score[-1].is_low_grade
         if is_low_grade and subject == Subjects.ENGLISH: return
         subject_code, subject_name = subject.value
 
@@ -129,43 +452,44 @@ class ScoreAnalyseService:
             _subject: SubjectScore = getattr(class_score, subject_code)
             if _subject.care_stu_array.size == 0 or class_score.name == '校平': continue
 
-            set_title_cell(grade_sheet.cell(row.value, name_col),
-                           f'{class_score.name}班{subject_name}（{_subject.care_stu_array.size}）')
+            care_title = f'{class_score.name}班{subject_name}（{_subject.care_stu_array.size}）'
+            yield row.value, name_col, care_title, TITLE_STYLE
             row.next()
 
             if subject != Subjects.TWO:
-                set_title_cell(grade_sheet.cell(row.value, name_col), '姓名')
-                set_title_cell(grade_sheet.cell(row.value, score_col), '分数')
+                yield row.value, name_col, '姓名', TITLE_STYLE
+                yield row.value, score_col, '分数', TITLE_STYLE
             else:
-                set_title_cell(grade_sheet.cell(row.value, name_col), '姓名')
-                set_title_cell(grade_sheet.cell(row.value, score_col), Subjects.CHINESE.value[1])
-                set_title_cell(grade_sheet.cell(row.value, score_col + 1), Subjects.MATH.value[1])
+                yield row.value, name_col, '姓名', TITLE_STYLE
+                yield row.value, score_col, Subjects.CHINESE.value[1], TITLE_STYLE
+                yield row.value, score_col + 1, Subjects.MATH.value[1], TITLE_STYLE
                 if class_score.is_low_grade:
-                    set_title_cell(grade_sheet.cell(row.value, score_col + 2), Subjects.TWO.value[1])
+                    yield row.value, score_col + 2, Subjects.TWO.value[1], TITLE_STYLE
                 else:
-                    set_title_cell(grade_sheet.cell(row.value, score_col + 2), Subjects.ENGLISH.value[1])
-                    set_title_cell(grade_sheet.cell(row.value, score_col + 3), Subjects.TWO.value[1])
+                    yield row.value, score_col + 2, Subjects.ENGLISH.value[1], TITLE_STYLE
+                    yield row.value, score_col + 3, Subjects.TWO.value[1], TITLE_STYLE
             row.next()
 
             for stu in _subject.care_stu_array:
                 if subject != Subjects.TWO:
-                    set_cell(grade_sheet.cell(row.value, name_col), stu['name'])
-                    set_cell(grade_sheet.cell(row.value, score_col), stu[subject_code])
+                    yield row.value, name_col, stu['name'], CELL_STYLE
+                    yield row.value, score_col, stu[subject_code], CELL_STYLE
                 else:
-                    set_cell(grade_sheet.cell(row.value, name_col), stu['name'])
-                    set_cell(grade_sheet.cell(row.value, score_col), stu[Subjects.CHINESE.value[0]])
-                    set_cell(grade_sheet.cell(row.value, score_col + 1), stu[Subjects.MATH.value[0]])
+                    yield row.value, name_col, stu['name'], CELL_STYLE
+                    yield row.value, score_col, stu[Subjects.CHINESE.value[0]], CELL_STYLE
+                    yield row.value, score_col + 1, stu[Subjects.MATH.value[0]], CELL_STYLE
                     if class_score.is_low_grade:
-                        set_cell(grade_sheet.cell(row.value, score_col + 2), stu[Subjects.TWO.value[0]])
+                        yield row.value, score_col + 2, stu[Subjects.TWO.value[0]], CELL_STYLE
                     else:
-                        set_cell(grade_sheet.cell(row.value, score_col + 2), stu[Subjects.ENGLISH.value[0]])
-                        set_cell(grade_sheet.cell(row.value, score_col + 3), stu[Subjects.TWO.value[0]])
+                        yield row.value, score_col + 2, stu[Subjects.ENGLISH.value[0]], CELL_STYLE
+                        yield row.value, score_col + 3, stu[Subjects.TWO.value[0]], CELL_STYLE
                 row.next()
             row.next()
 
     # 保存分析结果PPT
-    def write_pptx(self, school_ppt, title, school_score, subject: Subjects):
-        is_low_grade = title == '一年级' or title == '二年级'
+    @classmethod
+    def write_pptx(cls, school_ppt, title, school_score, subject: Subjects, district: GradeAggregate = None):
+        is_low_grade = school_score[-1].is_low_grade
         if is_low_grade and subject == Subjects.ENGLISH: return
         subject_code, subject_name = subject.value
 
@@ -197,62 +521,56 @@ class ScoreAnalyseService:
                 headers = ['班级', '平均分', '三科\v及格人数', f'三科\v及格率', '关爱\v平均分', '总评', '与校\v平差',
                            '与区\v平差', '名次', '班主任']
 
-        # 成绩表格排版
+        # 成绩表格排版：表头和行列尺寸由表格模板复制，单元格批量填写
         ppt_width = school_ppt.slide_width.inches
         # ppt_height = school_ppt.slide_height.inches
         max_row = len(school_score) + 2
-        max_column = len(headers)
         width = Inches(1.2)
         height = Inches(0.5)
         left = Inches((ppt_width - len(headers) * 1.2) / 2)
         top = Inches(1.5)
-        table = class_slide.shapes.add_table(max_row, max_column, left, top, width, height).table
 
-        for idx, header in enumerate(headers):
-            table.columns[idx].width = width
-            set_center_cell(table.cell(0, idx), header)
+        # 有区级聚合时补充区平行、与区平差和区内名次
+        district_score = None if district is None else district.to_class_score()
+        district_subject: SubjectScore = getattr(district_score, subject_code, None)
+        class_scores = school_score if district_score is None else school_score + [district_score]
+        table = add_table(class_slide, headers, max_row, len(class_scores), left, top, width, height)
 
         row = CellIndex()
-
+        cells = []
         color = None
-        for idx, class_score in enumerate(school_score):
+        for idx, class_score in enumerate(class_scores):
             _subject: SubjectScore = getattr(class_score, subject_code)
             row_idx = row.value
-            table.rows[row_idx].height = height
 
             if is_low_grade:
                 if subject == Subjects.CHINESE or subject == Subjects.MATH:
-                    set_center_cell(table.cell(row_idx, 0), class_score.name, color)
-                    set_center_cell(table.cell(row_idx, 1), self.to_string(_subject.mean), color)
-                    set_center_cell(table.cell(row_idx, 2), self.to_string(_subject.pass_stu[1]), color)
-                    set_center_cell(table.cell(row_idx, 3), self.to_string(_subject.care_stu_2[2]), color)
+                    values = [class_score.name, _subject.mean, _subject.pass_stu[1], _subject.care_stu_2[2]]
                 else:
-                    set_center_cell(table.cell(row_idx, 0), class_score.name, color)
-                    set_center_cell(table.cell(row_idx, 1), self.to_string(_subject.mean), color)
-                    set_center_cell(table.cell(row_idx, 2), self.to_string(_subject.pass_stu[0]), color)
-                    set_center_cell(table.cell(row_idx, 3), self.to_string(_subject.pass_stu[1]), color)
-                    set_center_cell(table.cell(row_idx, 4), self.to_string(_subject.care_stu_2[2]), color)
+                    values = [class_score.name, _subject.mean, _subject.pass_stu[0], _subject.pass_stu[1],
+                              _subject.care_stu_2[2]]
             else:
                 if subject == Subjects.CHINESE or subject == Subjects.MATH:
-                    set_center_cell(table.cell(row_idx, 0), class_score.name, color)
-                    set_center_cell(table.cell(row_idx, 1), self.to_string(_subject.mean), color)
-                    set_center_cell(table.cell(row_idx, 2), self.to_string(_subject.pass_stu[1]), color)
-                    set_center_cell(table.cell(row_idx, 3), self.to_string(_subject.care_stu_1[1]), color)
-                    set_center_cell(table.cell(row_idx, 4), self.to_string(_subject.top_stu[1]), color)
+                    values = [class_score.name, _subject.mean, _subject.pass_stu[1], _subject.care_stu_1[1],
+                              _subject.top_stu[1]]
                 elif subject == Subjects.ENGLISH:
-                    set_center_cell(table.cell(row_idx, 0), class_score.name, color)
-                    set_center_cell(table.cell(row_idx, 1), self.to_string(_subject.mean), color)
-                    set_center_cell(table.cell(row_idx, 2), self.to_string(_subject.pass_stu[1]), color)
-                    set_center_cell(table.cell(row_idx, 3), self.to_string(_subject.care_stu_1[1]), color)
+                    values = [class_score.name, _subject.mean, _subject.pass_stu[1], _subject.care_stu_1[1]]
                 else:
-                    set_center_cell(table.cell(row_idx, 0), class_score.name, color)
-                    set_center_cell(table.cell(row_idx, 1), self.to_string(_subject.mean), color)
-                    set_center_cell(table.cell(row_idx, 2), self.to_string(_subject.pass_stu[0]), color)
-                    set_center_cell(table.cell(row_idx, 3), self.to_string(_subject.pass_stu[1]), color)
-                    set_center_cell(table.cell(row_idx, 4), self.to_string(_subject.care_stu_1[1]), color)
+                    values = [class_score.name, _subject.mean, _subject.pass_stu[0], _subject.pass_stu[1],
+                              _subject.care_stu_1[1]]
+            cells.append((row_idx, 0, class_score.name))
+            cells += [(row_idx, col_idx, cls.to_string(value)) for col_idx, value in enumerate(values[1:], 1)]
+            if district_score is not None and class_score is not district_score:
+                district_diff = cls.to_string(_subject.mean - district_subject.mean)
+                cells.append((row_idx, headers.index('与区\v平差'), district_diff))
+                if not class_score.is_school_class:
+                    district_rank = str(district.rank(subject_code, _subject.mean))
+                    cells.append((row_idx, headers.index('名次'), district_rank))
             row.next()
-        set_center_cell(table.cell(row.value, 0), '区平', color)
-        row.next()
+        if district_score is None:
+            cells.append((row.value, 0, '区平'))
+            row.next()
+        fill_center_cells(table, cells, color)
 
     @staticmethod
     def to_string(number):
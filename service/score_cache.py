@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+
+from model.score_model import GradeScore
+from model.score_rules import GradeRule
+from model.student_model import STU_DTYPE
+
+# 缓存格式版本，解析规则变化时递增使旧缓存失效
+CACHE_VERSION = 2
+# 默认缓存上限 512MB
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ScoreCache:
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES):
+        # 每个年级一份缓存：{年级}.npy 学生成绩，{年级}.json 缓存键、班级信息和编码名称
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    # 读取年级缓存，命中时以内存映射方式打开学生成绩
+    def load(self, grade_name, key, rule: GradeRule = None) -> Optional[GradeScore]:
+        array_path, meta_path = self.entry_paths(grade_name)
+        try:
+            with open(meta_path, encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+            if meta['key'] != key: return None
+            array = np.load(array_path, mmap_mode='r')
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        class_codes = np.repeat(np.arange(len(meta['class_sizes'])), meta['class_sizes'])
+        return GradeScore(grade_name, meta['class_names'], array, class_codes, rule, meta['code_names'])
+
+    # 保存年级缓存，写入临时文件后替换，避免中断时留下损坏的缓存
+    def save(self, grade_name, key, grade_score: GradeScore):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        array_path, meta_path = self.entry_paths(grade_name)
+        meta = {'key': key, 'class_names': list(grade_score.class_names),
+                'class_sizes': grade_score.class_sizes.tolist(), 'code_names': grade_score.code_names}
+        with open(f'{array_path}.tmp', 'wb') as array_file:
+            np.save(array_file, np.ascontiguousarray(grade_score.array))
+        os.replace(f'{array_path}.tmp', array_path)
+        with open(f'{meta_path}.tmp', 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file, ensure_ascii=False)
+        os.replace(f'{meta_path}.tmp', meta_path)
+        self.evict()
+
+    # 超出缓存上限时按最近使用时间淘汰，多进程同时淘汰时其他进程已删除的缓存直接跳过
+    def evict(self):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.json'): continue
+            grade_name = file_name[:-len('.json')]
+            array_path, meta_path = self.entry_paths(grade_name)
+            try:
+                mtime = os.path.getmtime(meta_path)
+                size = os.path.getsize(meta_path) + self.file_size(array_path)
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, size, grade_name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, grade_name in sorted(entries):
+            if total <= self.max_bytes: break
+            self.remove(grade_name)
+            total -= size
+            logging.info(f'{grade_name}成绩缓存已淘汰')
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir): return
+        for file_name in os.listdir(self.cache_dir):
+            try:
+                os.remove(f'{self.cache_dir}/{file_name}')
+            except FileNotFoundError:
+                pass
+        logging.info('成绩缓存已清空')
+
+    def remove(self, grade_name):
+        for path in self.entry_paths(grade_name):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def file_size(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def entry_paths(self, grade_name):
+        return f'{self.cache_dir}/{grade_name}.npy', f'{self.cache_dir}/{grade_name}.json'
+
+    # 缓存键：文件内容哈希 + 修改时间 + 成绩数组结构
+    @staticmethod
+    def file_key(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(1024 * 1024), b''): digest.update(block)
+        digest.update(f'{os.stat(file_path).st_mtime_ns}|{STU_DTYPE.descr}|{CACHE_VERSION}'.encode())
+        return digest.hexdigest()
@@ -0,0 +1,98 @@
+import csv
+import os
+from typing import Dict, List
+
+import numpy as np
+from numpy import ndarray
+
+from model.score_model import ClassScore, SubjectScore
+from model.student_model import STU_DTYPE, STU_COLUMNS
+from model.subject_model import Subjects
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # 未安装pyarrow时导出为CSV
+    pyarrow = None
+
+# 班级科目指标表，每个班级（含校平）每科一行
+METRIC_DTYPE = np.dtype([('grade', 'U8'), ('class', 'U32'), ('subject', 'U8'), ('total_stu', 'i4'),
+                         ('mean', 'f8'), ('pass_count', 'i4'), ('pass_rate', 'f8'), ('top_count', 'i4'),
+                         ('top_rate', 'f8'), ('care_count', 'i4'), ('care_mean', 'f8'), ('care_line', 'f8'),
+                         ('care_count_2', 'i4'), ('care_rate_2', 'f8')])
+# 关爱学生表，在学生成绩字段前加上年级、班级和科目，成绩中的年级、班级编码还原为名称
+CARE_DTYPE = np.dtype([('grade', 'U8'), ('class', 'U32'), ('subject', 'U8'), ('grade_name', 'U32'),
+                       ('class_name', 'U32')] + [(name, STU_DTYPE[name]) for name in STU_COLUMNS])
+
+
+class ScoreExporter:
+
+    def __init__(self, export_dir):
+        # 列式导出目录，有pyarrow时为Parquet，否则为CSV
+        self.export_dir = export_dir
+        self.extension = 'csv' if pyarrow is None else 'parquet'
+        self.metric_path = f'{export_dir}/成绩分析指标.{self.extension}'
+        self.care_path = f'{export_dir}/关爱学生.{self.extension}'
+
+    def export(self, school_scores: Dict[str, List[ClassScore]]):
+        os.makedirs(self.export_dir, exist_ok=True)
+        self.write_table(self.metric_path, self.metric_table(school_scores))
+        self.write_table(self.care_path, self.care_table(school_scores))
+        return self.metric_path, self.care_path
+
+    # 导出的科目与工作表一致，低年级没有英语
+    @staticmethod
+    def subject_scores(school_scores: Dict[str, List[ClassScore]]):
+        for title, school_score in school_scores.items():
+            for class_score in school_score:
+                for subject in Subjects:
+                    if class_score.is_low_grade and subject == Subjects.ENGLISH: continue
+                    subject_code, _ = subject.value
+                    yield title, class_score, subject_code, getattr(class_score, subject_code)
+
+    @classmethod
+    def metric_table(cls, school_scores: Dict[str, List[ClassScore]]) -> ndarray:
+        rows = []
+        for title, class_score, subject_code, _subject in cls.subject_scores(school_scores):
+            _subject: SubjectScore
+            rows.append((title, class_score.name, subject_code, class_score.total_stu, _subject.mean,
+                         *_subject.pass_stu, *_subject.top_stu, *_subject.care_stu_1, *_subject.care_stu_2))
+        return np.array(rows, dtype=METRIC_DTYPE)
+
+    # 各班关爱学生按列整体复制，不逐行生成对象
+    @classmethod
+    def care_table(cls, school_scores: Dict[str, List[ClassScore]]) -> ndarray:
+        care_arrays = [(title, class_score, subject_code, _subject.care_stu_array) for
+                       title, class_score, subject_code, _subject in cls.subject_scores(school_scores)
+                       if not class_score.is_school_class and _subject.care_stu_array is not None]
+        table = np.empty(sum(care_array.size for *_, care_array in care_arrays), dtype=CARE_DTYPE)
+        start = 0
+        for title, class_score, subject_code, care_array in care_arrays:
+            end = start + care_array.size
+            table['grade'][start:end] = title
+            table['class'][start:end] = class_score.name
+            table['subject'][start:end] = subject_code
+            table['grade_name'][start:end] = class_score.decode(care_array, 'grade_code')
+            table['class_name'][start:end] = class_score.decode(care_array, 'class_code')
+            for name in STU_COLUMNS: table[name][start:end] = care_array[name]
+            start = end
+        return table
+
+    def write_table(self, path, table: ndarray):
+        if pyarrow is not None:
+            arrow_table = pyarrow.table({name: table[name] for name in table.dtype.names})
+            pyarrow.parquet.write_table(arrow_table, f'{path}.tmp')
+        else:
+            # 姓名等文本中的逗号、引号由csv模块转义
+            with open(f'{path}.tmp', 'w', newline='', encoding='utf-8') as table_file:
+                writer = csv.writer(table_file)
+                writer.writerow(table.dtype.names)
+                writer.writerows(zip(*(self.csv_column(table[name]) for name in table.dtype.names)))
+        os.replace(f'{path}.tmp', path)
+
+    # CSV列的值：float32成绩写出可精确还原的最短表示（同float32的repr），float64指标按repr写出，不截断
+    @staticmethod
+    def csv_column(column: ndarray):
+        if column.dtype == np.float32: return [np.format_float_positional(value, trim='-') for value in column]
+        return column.tolist()
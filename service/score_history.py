@@ -0,0 +1,144 @@
+import json
+import os
+import re
+from typing import List, Optional
+
+import numpy as np
+from numpy import ndarray
+
+from model.score_model import ClassScore, SubjectScore
+from model.student_model import STU_DTYPE, STU_COLUMNS
+from model.subject_model import Subjects
+
+# 学生键：班级名称和姓名，以\x00分隔后按字符串排序
+KEY_SEP = '\x00'
+# 历史学生表：学生键 班级名称 学生成绩（不含年级、班级编码） 各科是否在关爱名单中
+HISTORY_DTYPE = np.dtype([('key', 'U80'), ('class', 'U32')] + [(name, STU_DTYPE[name]) for name in STU_COLUMNS] +
+                         [(f'care_{code}', '?') for code, _ in Subjects.values()])
+# 年级顺序，入学年份 = 学年起始年份 - 年级序号
+GRADES = ['一年级', '二年级', '三年级', '四年级', '五年级', '六年级']
+
+
+class TermHistory:
+
+    def __init__(self, history_dir, term, school_year=None):
+        # 各学期学生成绩：{学期}/{入学年份}级.npy 按学生键排序，terms.json 记录学期先后顺序
+        # 按届保存，升入下一年级的同一批学生与上学期对比，下一学年的同名年级是另一届学生
+        self.history_dir = history_dir
+        self.term = term
+        self.terms_path = f'{history_dir}/terms.json'
+        # 学年起始年份，未指定时取学期名称开头的年份，如 2024-2025上 为2024
+        if school_year is None:
+            match = re.match(r'\d{4}', term)
+            if match is None: raise ValueError(f'无法从学期名称确定学年：{term}，请指定学年起始年份')
+            school_year = int(match.group())
+        self.school_year = school_year
+
+    def terms(self) -> List[str]:
+        try:
+            with open(self.terms_path, encoding='utf-8') as terms_file:
+                return json.load(terms_file)
+        except (OSError, ValueError):
+            return []
+
+    # 当前学期之前的最近一个学期
+    def previous_term(self) -> Optional[str]:
+        terms = self.terms()
+        if self.term in terms: terms = terms[:terms.index(self.term)]
+        return terms[-1] if terms else None
+
+    # 年级在本学年对应的届，不在年级顺序中的年级按年级名称保存
+    def cohort(self, title):
+        if title not in GRADES: return title
+        return f'{self.school_year - GRADES.index(title)}级'
+
+    def table_path(self, term, title):
+        return f'{self.history_dir}/{term}/{self.cohort(title)}.npy'
+
+    def load(self, term, title) -> Optional[ndarray]:
+        if term is None or not os.path.exists(self.table_path(term, title)): return None
+        return np.load(self.table_path(term, title), mmap_mode='r')
+
+    # 保存本学期年级学生表，学期首次保存时追加到学期顺序中
+    def record(self, title, school_score: List[ClassScore]):
+        table_path = self.table_path(self.term, title)
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        with open(f'{table_path}.tmp', 'wb') as table_file:
+            np.save(table_file, self.student_table(school_score))
+        os.replace(f'{table_path}.tmp', table_path)
+
+        terms = self.terms()
+        if self.term not in terms:
+            with open(f'{self.terms_path}.tmp', 'w', encoding='utf-8') as terms_file:
+                json.dump(terms + [self.term], terms_file, ensure_ascii=False)
+            os.replace(f'{self.terms_path}.tmp', self.terms_path)
+
+    # 与上学期对比，填写各班各科平均分变化和连续关爱人数，返回是否有上学期数据
+    def apply_trend(self, title, school_score: List[ClassScore]) -> bool:
+        previous = self.load(self.previous_term(), title)
+        if previous is None: return False
+        current = self.student_table(school_score)
+        matched, positions = self.join(current['key'], previous['key'])
+        previous_classes = self.class_index(previous['class'])
+
+        for subject in Subjects:
+            subject_code, _ = subject.value
+            care_repeat = current[f'care_{subject_code}'] & matched
+            care_repeat[matched] &= previous[f'care_{subject_code}'][positions[matched]]
+            for class_score in school_score:
+                _subject: SubjectScore = getattr(class_score, subject_code)
+                if class_score.is_school_class:
+                    previous_scores = previous[subject_code]
+                    class_mask = np.ones(current.size, dtype=bool)
+                else:
+                    previous_scores = previous[subject_code][previous_classes.get(class_score.name, slice(0))]
+                    class_mask = current['class'] == class_score.name
+                if previous_scores.size == 0: continue
+                previous_mean = float(previous_scores.mean(dtype=np.float64))
+                if subject == Subjects.TWO: previous_mean /= 2
+                _subject.mean_delta = _subject.round(_subject.mean - previous_mean)
+                _subject.care_repeat = int(np.count_nonzero(care_repeat & class_mask))
+        return True
+
+    # 本学期与上学期均有成绩的学生的单科分数变化（学生键，变化）
+    def student_deltas(self, title, school_score: List[ClassScore], subject: Subjects):
+        previous = self.load(self.previous_term(), title)
+        current = self.student_table(school_score)
+        if previous is None: return current['key'][:0], np.empty(0, dtype=np.float32)
+        subject_code, _ = subject.value
+        matched, positions = self.join(current['key'], previous['key'])
+        return current['key'][matched], current[subject_code][matched] - previous[subject_code][positions[matched]]
+
+    # 有序键的向量化连接：返回是否匹配以及在other中的位置
+    @staticmethod
+    def join(keys: ndarray, other_keys: ndarray):
+        if other_keys.size == 0: return np.zeros(keys.size, dtype=bool), np.zeros(keys.size, dtype=np.intp)
+        positions = np.minimum(np.searchsorted(other_keys, keys), other_keys.size - 1)
+        return other_keys[positions] == keys, positions
+
+    # 按班级名称排序后各班的连续区间
+    @staticmethod
+    def class_index(class_names: ndarray):
+        order = np.argsort(class_names, kind='stable')
+        names, starts, counts = np.unique(class_names[order], return_index=True, return_counts=True)
+        return {str(name): order[start:start + count] for name, start, count in zip(names, starts, counts)}
+
+    # 年级学生表：按学生键排序，同班同名只保留第一名学生
+    @staticmethod
+    def student_table(school_score: List[ClassScore]) -> ndarray:
+        class_scores = [class_score for class_score in school_score if not class_score.is_school_class]
+        table = np.zeros(sum(class_score.array.size for class_score in class_scores), dtype=HISTORY_DTYPE)
+        start = 0
+        for class_score in class_scores:
+            array = class_score.array
+            end = start + array.size
+            table['class'][start:end] = class_score.name
+            table['key'][start:end] = np.char.add(f'{class_score.name}{KEY_SEP}', array['name'])
+            for name in STU_COLUMNS: table[name][start:end] = array[name]
+            for code, _ in Subjects.values():
+                care_array = getattr(class_score, code).care_stu_array
+                if care_array is not None and care_array.size:
+                    table[f'care_{code}'][start:end] = np.isin(array['name'], care_array['name'])
+            start = end
+        _, first = np.unique(table['key'], return_index=True)
+        return table[first]
@@ -0,0 +1,113 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不记录进程内存峰值
+    resource = None
+
+# 环境变量开启监控：time 只计时，memory（或1）同时统计内存峰值
+MONITOR_ENV = 'SCORE_MONITOR'
+MONITOR_MODES = ['time', 'memory']
+
+# 监控关闭时共用的空上下文
+NULL_STAGE = nullcontext()
+
+
+class StageMonitor:
+
+    def __init__(self, mode=None, profile_path=None):
+        # 监控模式 None为关闭，cProfile结果保存路径
+        self.enabled = mode is not None
+        self.trace_memory = mode == 'memory'
+        self.profile_path = profile_path
+        # 各阶段记录（阶段，年级，班级，耗时，内存峰值）
+        self.records = []
+        # 嵌套阶段各层已观测到的内存峰值
+        self.peaks = []
+
+    @classmethod
+    def from_env(cls, mode=None, profile_path=None):
+        if mode is None: mode = os.environ.get(MONITOR_ENV) or None
+        if mode == '1': mode = 'memory'
+        return cls(mode if mode in MONITOR_MODES else None, profile_path)
+
+    # 关闭时返回共享的空上下文，不产生额外开销
+    def stage(self, stage, grade=None, class_name=None):
+        if not self.enabled: return NULL_STAGE
+        return self.timed_stage(stage, grade, class_name)
+
+    @contextmanager
+    def timed_stage(self, stage, grade, class_name):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing(): tracemalloc.start()
+            self.observe_peak()
+            self.peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': stage, 'grade': grade, 'class': class_name, 'seconds': time.perf_counter() - start}
+            if self.trace_memory:
+                self.observe_peak()
+                record['peak_memory'] = self.peaks.pop()
+                # 内层阶段的峰值也计入外层阶段
+                if self.peaks: self.peaks[-1] = max(self.peaks[-1], record['peak_memory'])
+            if resource is not None: record['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.records.append(record)
+
+    def observe_peak(self):
+        _, peak = tracemalloc.get_traced_memory()
+        self.peaks = [max(observed, peak) for observed in self.peaks]
+        tracemalloc.reset_peak()
+
+    # 整体运行的cProfile统计
+    def profile(self):
+        if self.profile_path is None: return NULL_STAGE
+        return self.profiled()
+
+    @contextmanager
+    def profiled(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(self.profile_path)
+
+    def merge(self, records):
+        self.records.extend(records)
+
+    def summary(self):
+        totals, grades = {}, {}
+        for record in self.records:
+            stage, grade = record['stage'], record['grade']
+            # 班级阶段已包含在年级阶段中，只计入明细
+            if record['class'] is not None: continue
+            totals[stage] = totals.get(stage, 0.0) + record['seconds']
+            if grade is not None:
+                grade_stages = grades.setdefault(grade, {})
+                grade_stages[stage] = grade_stages.get(stage, 0.0) + record['seconds']
+        return {'mode': 'memory' if self.trace_memory else 'time', 'totals': totals, 'grades': grades,
+                'stages': self.records}
+
+    def save(self, path):
+        if not self.enabled: return
+        with open(path, 'w', encoding='utf-8') as summary_file:
+            json.dump(self.summary(), summary_file, ensure_ascii=False, indent=2)
+
+    # 进程池中只传递监控配置，不传递已有记录
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['records'], state['peaks'] = [], []
+        return state
+
+
+# 关闭状态的监控，作为默认参数使用
+NULL_MONITOR = StageMonitor()
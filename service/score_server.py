@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse, parse_qs, urlencode
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from model.score_model import GradeScore
+from model.student_model import decode
+from model.subject_model import Subjects
+from service.score_analyse import ScoreAnalyseService
+
+# 默认监听地址和端口，只在本机提供服务
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+# 检查成绩文件变化的间隔（秒）
+POLL_INTERVAL = 1.0
+# 可查询的科目指标
+METRICS = ['mean', 'pass_stu', 'top_stu', 'care_stu_1', 'care_stu_2', 'care_stu_array']
+
+
+class ScoreServer:
+
+    def __init__(self, service: ScoreAnalyseService, host=SERVER_HOST, port=SERVER_PORT, poll_interval=POLL_INTERVAL):
+        # 常驻分析服务：内存中保留各年级成绩，成绩文件变化时只重新解析该年级
+        self.service = service
+        self.poll_interval = poll_interval
+        # 年级 -> （文件状态，年级成绩）
+        self.grades: Dict[str, Tuple[Tuple, GradeScore]] = {}
+        # 查询会缓存指标，加载、查询和生成报表互斥执行
+        self.lock = threading.Lock()
+        # 监视线程和POST /reload可能同时触发重新加载，同一时间只有一个线程解析年级文件
+        self.reload_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), ScoreRequestHandler)
+        self.httpd.score_server = self
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def serve_forever(self):
+        self.reload()
+        watcher = threading.Thread(target=self.watch, daemon=True)
+        watcher.start()
+        logging.info(f'成绩分析服务已启动：{self.url}')
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.stopped.set()
+            self.httpd.server_close()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+
+    # 定时检查成绩文件状态
+    def watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception:
+                logging.exception('成绩文件重新加载失败')
+
+    # 重新解析状态变化的年级，删除的年级不再提供查询，返回变化的年级
+    def reload(self):
+        changed = []
+        with self.reload_lock:
+            for file_path in self.service.file_paths:
+                title = self.service.grade_title(file_path)
+                stat = self.file_stat(file_path)
+                loaded = self.grades.get(title)
+                if loaded is not None and loaded[0] == stat: continue
+                grade_score = None if stat is None else self.service.grade_load(title, file_path)
+                with self.lock:
+                    if grade_score is None:
+                        self.grades.pop(title, None)
+                    else:
+                        self.grades[title] = stat, grade_score
+                changed.append(title)
+                logging.info(f'{title}{"已移除" if grade_score is None else "已加载"}')
+        return changed
+
+    @staticmethod
+    def file_stat(file_path):
+        if not os.path.exists(file_path): return None
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    # 已加载的年级按年级文件顺序排列，与批量分析的工作表和幻灯片顺序一致，调用时需持有lock
+    def loaded_grades(self) -> List[Tuple[str, GradeScore]]:
+        titles = [self.service.grade_title(file_path) for file_path in self.service.file_paths]
+        return [(title, self.grades[title][1]) for title in titles if title in self.grades]
+
+    def grade_list(self):
+        with self.lock:
+            return [{'grade': title, 'classes': grade_score.class_names, 'total_stu': int(grade_score.array.size)}
+                    for title, grade_score in self.loaded_grades()]
+
+    # 查询单个指标，未指定指标时返回全部汇总指标
+    def metric(self, title, class_name, subject: Subjects, metric=None):
+        with self.lock:
+            _, grade_score = self.grades[title]
+            class_names = grade_score.code_names.get('class_code', [])
+            if metric is not None: return to_json(grade_score.get(class_name, subject, metric), class_names)
+            return {name: to_json(grade_score.get(class_name, subject, name), class_names) for name in METRICS[:-1]}
+
+    # 用内存中的年级成绩重新生成结果工作簿和PPT
+    def write_reports(self):
+        with self.lock:
+            start = time.perf_counter()
+            grade_scores = [(title, grade_score.analyse()) for title, grade_score in self.loaded_grades()]
+            self.service.full_analyse(grade_scores)
+            return {'grades': [title for title, _ in grade_scores], 'seconds': time.perf_counter() - start,
+                    'excel': self.service.result_path, 'pptx': self.service.ppt_result_path}
+
+
+class ScoreRequestHandler(BaseHTTPRequestHandler):
+    # GET /grades 年级列表
+    # GET /metrics?grade=三年级&class=校平&subject=math[&metric=pass_stu] 指标查询
+    # POST /reload 立即检查成绩文件   POST /reports 重新生成报表
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        server: ScoreServer = self.server.score_server
+        if url.path == '/grades': return self.send_json(200, server.grade_list())
+        if url.path != '/metrics': return self.send_json(404, {'error': f'未知路径：{url.path}'})
+
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        subject = next((subject for subject in Subjects if subject.value[0] == query.get('subject')), None)
+        metric = query.get('metric')
+        if subject is None: return self.send_json(400, {'error': f'未知科目：{query.get("subject")}'})
+        if metric is not None and metric not in METRICS: return self.send_json(400, {'error': f'未知指标：{metric}'})
+        try:
+            value = server.metric(query.get('grade'), query.get('class', '校平'), subject, metric)
+        except (KeyError, ValueError):
+            return self.send_json(404, {'error': f'未找到年级或班级：{query.get("grade")} {query.get("class")}'})
+        self.send_json(200, value)
+
+    def do_POST(self):
+        server: ScoreServer = self.server.score_server
+        if self.path == '/reload': return self.send_json(200, {'changed': server.reload()})
+        if self.path == '/reports': return self.send_json(200, server.write_reports())
+        self.send_json(404, {'error': f'未知路径：{self.path}'})
+
+    def send_json(self, status, value):
+        body = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'{self.address_string()} {format % args}')
+
+
+# 指标转为JSON值，关爱学生列表转为（班级，姓名，各科成绩），班级编码按class_names还原为名称
+def to_json(value, class_names: List[str] = ()):
+    if isinstance(value, np.ndarray):
+        classes = decode(value['class_code'], list(class_names))
+        return [{'class': str(class_name), 'name': str(stu['name']),
+                 **{code: float(stu[code]) for code, _ in Subjects.values()}}
+                for class_name, stu in zip(classes, value)]
+    if isinstance(value, tuple): return [to_json(item, class_names) for item in value]
+    if isinstance(value, (np.integer, int)): return int(value)
+    if isinstance(value, (np.floating, float)): return None if np.isnan(value) else float(value)
+    return value
+
+
+class ScoreClient:
+
+    def __init__(self, url=f'http://{SERVER_HOST}:{SERVER_PORT}'):
+        # 本机常驻服务的客户端，只使用标准库
+        self.url = url
+
+    def grades(self):
+        return self.request('GET', '/grades')
+
+    def metric(self, grade, subject: Subjects, class_name='校平', metric=None):
+        query = {'grade': grade, 'class': class_name, 'subject': subject.value[0]}
+        if metric is not None: query['metric'] = metric
+        return self.request('GET', f'/metrics?{urlencode(query)}')
+
+    def reload(self):
+        return self.request('POST', '/reload')
+
+    def reports(self):
+        return self.request('POST', '/reports')
+
+    def request(self, method, path):
+        with urlopen(Request(f'{self.url}{path}', method=method)) as response:
+            return json.loads(response.read().decode('utf-8'))
@@ -0,0 +1,58 @@
+import os
+import pickle
+from typing import Dict, List, Optional, Tuple
+
+from model.score_model import ClassScore
+
+# 状态格式版本，分析结果结构变化时递增使旧状态失效
+STATE_VERSION = 4
+
+
+class GradeState:
+
+    def __init__(self, key, school_score: List[ClassScore], slides: Tuple[int, int]):
+        # 输入文件指纹 分析结果（不含学生成绩） 幻灯片位置（起始序号，张数）
+        self.key = key
+        self.school_score = [class_score.without_students() for class_score in school_score]
+        self.slides = slides
+
+
+class AnalyseState:
+
+    def __init__(self, state_path):
+        # 增量分析状态：各年级输入指纹和分析结果，以及上次结果文件的指纹
+        self.state_path = state_path
+        self.grades: Dict[str, GradeState] = {}
+        self.outputs: Tuple = ()
+
+    @classmethod
+    def load(cls, state_path) -> 'AnalyseState':
+        try:
+            with open(state_path, 'rb') as state_file:
+                version, state = pickle.load(state_file)
+            if version == STATE_VERSION and isinstance(state, cls):
+                state.state_path = state_path
+                return state
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError, TypeError):
+            pass
+        return cls(state_path)
+
+    def save(self, *output_paths):
+        self.outputs = self.output_keys(output_paths)
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(f'{self.state_path}.tmp', 'wb') as state_file:
+            pickle.dump((STATE_VERSION, self), state_file)
+        os.replace(f'{self.state_path}.tmp', self.state_path)
+
+    def grade(self, title, key) -> Optional[GradeState]:
+        grade_state = self.grades.get(title)
+        return grade_state if grade_state is not None and grade_state.key == key else None
+
+    # 上次结果文件仍在且未被改动，且年级顺序不变时才能按年级局部重写
+    def is_patchable(self, titles: List[str], *output_paths):
+        return list(self.grades) == titles and self.outputs == self.output_keys(output_paths)
+
+    @staticmethod
+    def output_keys(output_paths):
+        if not all(os.path.exists(path) for path in output_paths): return None
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in output_paths)
@@ -0,0 +1,55 @@
+import logging
+import re
+import zipfile
+
+import numpy as np
+import pytest
+from openpyxl import load_workbook
+
+from benchmark.school_data import generate_school
+from service.score_analyse import ScoreAnalyseService
+
+
+# 改写工作表记录的尺寸，模拟其他程序写出的行数偏少、偏多或没有<dimension>，max_row为None时删去
+def rewrite_dimensions(file_path, max_row):
+    with zipfile.ZipFile(file_path) as source:
+        items = [(info, source.read(info)) for info in source.infolist()]
+    dimension = b'' if max_row is None else rb'<dimension ref="A1:\g<1>%d"/>' % max_row
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info, data in items:
+            if info.filename.startswith('xl/worksheets/'):
+                data = re.sub(rb'<dimension ref="A1:([A-Z]+)\d+"\s*/>', dimension, data)
+            target.writestr(info, data)
+
+
+@pytest.mark.parametrize('grade_name, max_row', [('一年级', 4), ('三年级', 4), ('三年级', 1048576), ('一年级', None)])
+def test_chunked_analysis_ignores_wrong_dimensions(tmp_path, caplog, grade_name, max_row):
+    generate_school(str(tmp_path), classes=3, students=40, invalid_rate=0.1, grades=[grade_name])
+    file_path = f'{tmp_path}/data/read/{grade_name}.xlsx'
+    _, expected = ScoreAnalyseService(str(tmp_path), use_cache=False).file_analyse(file_path)
+    rewrite_dimensions(file_path, max_row)
+
+    # 后k名学生的容量按实际行数确定，与工作表尺寸无关
+    workbook = load_workbook(file_path, True, False, True)
+    for sheet in workbook.worksheets:
+        assert sheet.max_row == max_row
+        assert ScoreAnalyseService.sheet_rows(sheet) == len(list(ScoreAnalyseService.data_rows(sheet)))
+    workbook.close()
+
+    _, full_score = ScoreAnalyseService(str(tmp_path), use_cache=False).file_analyse(file_path)
+    assert [class_score.total_stu for class_score in full_score] == [score.total_stu for score in expected]
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        _, school_score = ScoreAnalyseService(str(tmp_path), use_cache=False, chunk_size=7).file_analyse(file_path)
+    assert len([record for record in caplog.records if '共忽略' in record.getMessage()]) == 1
+
+    for class_score, expected_score in zip(school_score, expected):
+        assert class_score.total_stu == expected_score.total_stu
+        for code in ['chinese', 'math', 'two']:
+            _subject, _expected = getattr(class_score, code), getattr(expected_score, code)
+            assert _subject.mean == _expected.mean
+            assert _subject.care_stu_1 == _expected.care_stu_1
+            assert _subject.care_stu_2 == _expected.care_stu_2
+            if not class_score.is_school_class:
+                assert _subject.care_stu_array.size > 0
+                assert np.array_equal(_subject.care_stu_array, _expected.care_stu_array)
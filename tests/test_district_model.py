@@ -0,0 +1,22 @@
+import numpy as np
+
+from model.district_model import SubjectAggregate
+from model.subject_model import Subjects
+
+
+def test_merged_care_stu_is_exact_for_fractional_scores():
+    rand = np.random.default_rng(3)
+    schools = [np.round(rand.uniform(0, 150, size) * 4).astype(np.float32) / 4 for size in (301, 457, 88)]
+    district = SubjectAggregate(Subjects.MATH, 0.2)
+    for scores in schools:
+        aggregate = SubjectAggregate(Subjects.MATH, 0.2)
+        aggregate.add(scores, 0, 0)
+        district.merge(aggregate)
+
+    scores = np.sort(np.concatenate(schools))
+    care_count = int(scores.size * 0.2)
+    count, line, mean = district.care_stu()
+    assert count == care_count
+    assert line == scores[care_count - 1]
+    assert np.isclose(mean, scores[:care_count].astype(np.float64).mean(), rtol=0, atol=1e-9)
+    assert district.total == scores.astype(np.float64).sum()
@@ -0,0 +1,23 @@
+import csv
+
+import numpy as np
+
+from service import score_export
+from service.score_export import ScoreExporter, CARE_DTYPE
+
+
+def test_csv_fallback_quotes_text_and_keeps_scores(tmp_path, monkeypatch):
+    monkeypatch.setattr(score_export, 'pyarrow', None)
+    table = np.zeros(2, dtype=CARE_DTYPE)
+    table['name'] = ['张,三', '李"四"']
+    table['chinese'] = [0.1, 100.25]
+    table['two'] = [1234567.1, 185.0]
+    ScoreExporter(str(tmp_path)).write_table(f'{tmp_path}/care.csv', table)
+
+    with open(f'{tmp_path}/care.csv', newline='', encoding='utf-8') as table_file:
+        header, *rows = list(csv.reader(table_file))
+    assert header == list(CARE_DTYPE.names)
+    assert [row[header.index('name')] for row in rows] == ['张,三', '李"四"']
+    for name in ['chinese', 'two']:
+        scores = np.array([row[header.index(name)] for row in rows], dtype=np.float32)
+        assert np.array_equal(scores, table[name])
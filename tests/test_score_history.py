@@ -0,0 +1,44 @@
+import numpy as np
+
+from model.score_model import GradeScore
+from model.student_model import STU_DTYPE
+from model.subject_model import Subjects
+from service.score_history import TermHistory
+
+
+# 两个班、每班20名学生的年级成绩，数学成绩统一加上math_offset
+def grade_scores(grade_name, math_offset=0.0, seed=0):
+    rand = np.random.default_rng(seed)
+    array = np.zeros(40, dtype=STU_DTYPE)
+    array['class_code'] = np.repeat([0, 1], 20)
+    array['name'] = [f'学生{idx:02d}' for idx in range(20)] * 2
+    for code in ['chinese', 'math', 'english']:
+        array[code] = np.round(rand.uniform(40, 90, array.size) * 2) / 2
+    array['math'] += math_offset
+    array['two'] = array['chinese'] + array['math']
+    codes = array['class_code'].astype(np.int64)
+    return GradeScore(grade_name, ['1', '2'], array, codes, code_names={'class_code': ['1', '2']}).analyse()
+
+
+def test_trend_follows_cohort_across_school_years(tmp_path):
+    history_dir = str(tmp_path)
+    last_year = TermHistory(history_dir, '2023-2024下')
+    last_year.record('三年级', grade_scores('三年级'))
+
+    this_year = TermHistory(history_dir, '2024-2025上')
+    assert this_year.previous_term() == '2023-2024下'
+    # 升入四年级的同一届学生与去年三年级对比
+    promoted = grade_scores('四年级', math_offset=5.0)
+    assert this_year.apply_trend('四年级', promoted)
+    for class_score in promoted:
+        assert class_score.math.mean_delta == 5.0
+        assert class_score.chinese.mean_delta == 0.0
+        assert class_score.math.care_repeat == class_score.math.care_stu_array.size
+
+    # 今年的三年级是新一届学生，没有上学期数据
+    new_cohort = grade_scores('三年级', seed=1)
+    assert not this_year.apply_trend('三年级', new_cohort)
+    assert all(class_score.math.mean_delta is None for class_score in new_cohort)
+
+    keys, deltas = this_year.student_deltas('四年级', promoted, Subjects.MATH)
+    assert keys.size == 40 and np.all(deltas == 5.0)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from model.chunk_model import ValueCounts
+from model.score_model import GradeScore
+from model.score_rules import PASS_SCORE, SINGLE_TOP_SCORE, TWO_TOP_SCORE, CARE_RATE, ScoreRules
+from model.student_model import STU_DTYPE
+from model.subject_model import Subjects
+
+
+# 随机年级成绩，分数精度0.1，各班人数不同
+def random_grade(rand: np.random.Generator, low_grade):
+    class_sizes = rand.integers(20, 60, size=rand.integers(2, 9))
+    array = np.zeros(class_sizes.sum(), dtype=STU_DTYPE)
+    array['class_code'] = np.repeat(np.arange(class_sizes.size), class_sizes)
+    array['name'] = [f'学生{idx:04d}' for idx in range(array.size)]
+    for code in ['chinese', 'math'] + ([] if low_grade else ['english']):
+        array[code] = np.clip(np.round(rand.normal(75, 15, array.size), 1), 0, 100)
+    array['two'] = array['chinese'] + array['math']
+    return array, class_sizes
+
+
+# 按班级逐科分析的原始算法：平均分为float32的ndarray.mean()，关爱学生为整体排序后的后20%
+def baseline_subject(stu_array, subject: Subjects, low_grade):
+    current, _ = subject.value
+    subject_array = stu_array[current]
+    if subject != Subjects.TWO:
+        mean = subject_array.mean()
+        pass_count = stu_array[subject_array >= PASS_SCORE].size
+        top_count = stu_array[subject_array >= SINGLE_TOP_SCORE].size
+    else:
+        pass_mask = (stu_array['chinese'] >= PASS_SCORE) & (stu_array['math'] >= PASS_SCORE)
+        if not low_grade: pass_mask &= stu_array['english'] >= PASS_SCORE
+        mean = subject_array.mean() / 2
+        pass_count = stu_array[pass_mask].size
+        top_count = stu_array[subject_array >= TWO_TOP_SCORE].size
+    care_count = int(stu_array.size * CARE_RATE)
+    care_array = np.sort(stu_array, order=current)[:care_count][::-1]
+    return mean, pass_count, top_count, care_array[current].mean(), care_array
+
+
+@pytest.mark.parametrize('grade_name', ['二年级', '四年级'])
+def test_analyse_matches_per_class_baseline(grade_name):
+    rand = np.random.default_rng(7)
+    low_grade = grade_name == '二年级'
+    for _ in range(50):
+        array, class_sizes = random_grade(rand, low_grade)
+        class_names = [str(idx + 1) for idx in range(class_sizes.size)]
+        school_score = GradeScore(grade_name, class_names, array, array['class_code'].astype(np.int64)).analyse()
+        bounds = np.concatenate(([0], np.cumsum(class_sizes)))
+        class_arrays = [array[start:end] for start, end in zip(bounds[:-1], bounds[1:])] + [array]
+        for class_score, stu_array in zip(school_score, class_arrays):
+            for subject in Subjects:
+                _subject = getattr(class_score, subject.value[0])
+                mean, pass_count, top_count, care_mean, care_array = baseline_subject(stu_array, subject, low_grade)
+                assert _subject.mean == _subject.round(mean)
+                assert _subject.pass_stu[0] == pass_count
+                assert _subject.top_stu[0] == top_count
+                assert _subject.care_stu_1 == (care_array.size, _subject.round(care_mean))
+                if not low_grade:
+                    assert np.array_equal(_subject.care_stu_array[subject.value[0]], care_array[subject.value[0]])
+
+
+# float32不能精确表示的分数线，压线的学生按逐行比较计入
+def test_thresholds_match_float32_scores():
+    rule = ScoreRules({'subjects': {'math': {'pass_score': 59.9, 'top_score': 90.1}}}).grade('四年级')
+    array = np.zeros(8, dtype=STU_DTYPE)
+    array['math'] = [90.1] * 4 + [59.9] * 2 + [50, 95]
+    array['chinese'] = array['english'] = 80
+    array['two'] = array['chinese'] + array['math']
+    grade_score = GradeScore('四年级', ['1'], array, np.zeros(8, dtype=np.int64), rule)
+    school_score = grade_score.analyse()[-1]
+    assert school_score.math.top_stu[0] == np.count_nonzero(array['math'] >= 90.1) == 5
+    assert school_score.math.pass_stu[0] == school_score.two.pass_stu[0] == 7
+    assert grade_score.rank(Subjects.MATH, 59.9) == 6
+    assert grade_score.rank(Subjects.MATH, 90.1) == 2
+
+    value_counts = ValueCounts()
+    value_counts.add(array['math'])
+    assert value_counts.count_ge(90.1) == 5
+    assert value_counts.count_le(59.9) == 3
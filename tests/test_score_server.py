@@ -0,0 +1,55 @@
+import os
+import threading
+
+import pytest
+
+from benchmark.school_data import generate_school
+from model.subject_model import Subjects
+from service.score_analyse import ScoreAnalyseService, DATA_FILES
+from service.score_server import ScoreServer, ScoreClient
+
+
+@pytest.fixture
+def server(tmp_path):
+    generate_school(str(tmp_path), classes=2, students=12)
+    score_server = ScoreServer(ScoreAnalyseService(str(tmp_path), use_cache=False), port=0, poll_interval=3600)
+    thread = threading.Thread(target=score_server.serve_forever, daemon=True)
+    thread.start()
+    yield score_server
+    score_server.shutdown()
+    thread.join(5)
+
+
+def grade_titles():
+    return [file_name.replace('.xlsx', '') for file_name in DATA_FILES]
+
+
+def test_grades_and_metrics(server):
+    client = ScoreClient(server.url)
+    grades = client.grades()
+    assert [grade['grade'] for grade in grades] == grade_titles()
+    assert grades[0]['classes'] == ['1', '2']
+
+    care_students = client.metric('三年级', Subjects.MATH, '1', 'care_stu_array')
+    assert care_students and all(stu['class'] == '1' for stu in care_students)
+    assert client.metric('三年级', Subjects.MATH)['care_stu_1'][0] == len(client.metric(
+        '三年级', Subjects.MATH, '校平', 'care_stu_array'))
+
+
+def test_reload_keeps_grade_order(server):
+    client = ScoreClient(server.url)
+    file_path = server.service.file_paths[0]
+    os.rename(file_path, f'{file_path}.saving')
+    assert client.reload() == {'changed': ['一年级']}
+    assert [grade['grade'] for grade in client.grades()] == grade_titles()[1:]
+
+    os.rename(f'{file_path}.saving', file_path)
+    assert client.reload() == {'changed': ['一年级']}
+    assert client.reload() == {'changed': []}
+    assert [grade['grade'] for grade in client.grades()] == grade_titles()
+
+
+def test_reports(server):
+    reports = ScoreClient(server.url).reports()
+    assert reports['grades'] == grade_titles()
+    assert os.path.exists(reports['excel']) and os.path.exists(reports['pptx'])
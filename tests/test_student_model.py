@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+import numpy as np
+
+from model.student_model import StudentBuffer, BLOCK_ROWS, numeric_mask, is_numeric, is_valid_stu
+
+
+def test_numeric_mask_matches_is_numeric():
+    values = [1, 2.5, None, True, False, '85', '缺考', np.float32(3), np.bool_(True), Decimal('1.5'), float('nan')]
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    assert numeric_mask(column).tolist() == [is_numeric(value) for value in values]
+
+
+def test_append_rows_matches_per_row_validation():
+    rows = [('三年级', 1, '甲', 80, 90.5, 70), ('三年级', 1, '乙', None, 60, 70), ('三年级', 2, '丙', 80, 60, '缺考'),
+            ('三年级', 2, '丁', '80', 60, None), ('三年级', 2, '戊', 59.5, True, 100)]
+    buffer = StudentBuffer()
+    assert buffer.append_rows(rows, '1') == sum(map(is_valid_stu, rows))
+    assert buffer.array['name'][:buffer.size].tolist() == ['甲', '丁', '戊']
+    assert buffer.rejected()['row'].tolist() == [3, 4]
+
+    # 低年级5列成绩，语文、数学必须为数字
+    low_rows = [('一年级', 1, '甲', 80, 90), ('一年级', 1, '乙', '缺考', 60), ('一年级', 1, '丙', 70, True)]
+    buffer = StudentBuffer()
+    assert buffer.append_rows(low_rows, '1') == 1
+    assert buffer.rejected()['reason'].tolist() == [2, 2]
+
+
+def test_append_sheet_blocks_keep_row_numbers():
+    rows = [('三年级', 1, f'学生{idx}', None if idx % 1000 == 0 else 80, 90, 70) for idx in range(BLOCK_ROWS * 2 + 10)]
+    buffer = StudentBuffer(16)
+    assert buffer.append_sheet(iter(rows), '1') == sum(map(is_valid_stu, rows))
+    # 跨块的被忽略行仍记录工作表行号，缓冲区按倍增扩容
+    assert buffer.rejected()['row'].tolist() == [idx + 2 for idx in range(0, len(rows), 1000)]
+    assert buffer.size < buffer.array.size < 2 * buffer.size